@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
 from . import models
+from .pagination import EstimatedCountPaginator
 
 # Register your models here.
 
@@ -40,16 +41,22 @@ class DegreeInline(admin.TabularInline):
     model = models.DoctorDegree
     extra = 0
 
+class WorkingHoursInline(admin.TabularInline):
+    model = models.WorkingHours
+    extra = 0
+
 @admin.register(models.Doctor)
 class DoctorAdmin(admin.ModelAdmin):
     list_display = ['first_name','last_name', 'specialization', 'email', 'phone_number', 
-                    'charges', 'location', 'approval_status']
+                    'charges', 'rating_avg', 'location', 'approval_status']
     list_per_page = 10
     list_editable = ['approval_status']
-    list_select_related = ['location']
-    search_fields = ['first_name__istartswith', 'last_name__istartswith', 'specialization__istartswith']    
+    list_select_related = ['user', 'location']
+    search_fields = ['user__first_name__istartswith', 'user__last_name__istartswith',
+                     'specialization__istartswith']
     list_filter = ['approval_status', 'specialization']
-    inlines = [DegreeInline]
+    readonly_fields = ['rating_avg', 'rating_count']
+    inlines = [DegreeInline, WorkingHoursInline]
     def location(self, doctor):
         return doctor.location.address + ", " + doctor.location.city + ", " + doctor.location.state
     
@@ -58,7 +65,8 @@ class DoctorAdmin(admin.ModelAdmin):
 class PatientAdmin(admin.ModelAdmin):
     list_display = ['first_name', 'last_name', 'gender', 'email', 'phone_number']
     list_per_page = 10
-    search_fields = ['first_name__istartswith', 'last_name__istartswith']
+    list_select_related = ['user']
+    search_fields = ['user__first_name__istartswith', 'user__last_name__istartswith']
 
 @admin.register(models.Location)
 class LocationAdmin(admin.ModelAdmin):
@@ -71,24 +79,32 @@ class LocationAdmin(admin.ModelAdmin):
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ['patient', 'doctor', 'date', 'time', 'approval']
     list_per_page = 10
-    search_fields = ['patient__first_name__istartswith', 'patient__last_name__istartswith',
-                     'doctor__first_name__istartswith', 'doctor__last_name__istartswith']
-    list_filter = ['approval', 'date', 'time']
+    list_select_related = ['patient__user', 'doctor__user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ['patient__user__first_name__istartswith', 'patient__user__last_name__istartswith',
+                     'doctor__user__first_name__istartswith', 'doctor__user__last_name__istartswith']
+    list_filter = ['approval', 'date']
 
 @admin.register(models.Prescription)
 class PrescriptionAdmin(admin.ModelAdmin):
     list_display = ['patient', 'doctor', 'date', 'prescription']
     list_per_page = 10
-    search_fields = ['patient__first_name__istartswith', 'patient__last_name__istartswith',
-                     'doctor__first_name__istartswith', 'doctor__last_name__istartswith']
+    list_select_related = ['patient__user', 'doctor__user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ['patient__user__first_name__istartswith', 'patient__user__last_name__istartswith',
+                     'doctor__user__first_name__istartswith', 'doctor__user__last_name__istartswith']
 
 @admin.register(models.Review)
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ['patient', 'doctor', 'rating', 'review']
     list_per_page = 10
-    search_fields = ['patient__first_name__istartswith', 'patient__last_name__istartswith',
-                     'doctor__first_name__istartswith', 'doctor__last_name__istartswith',
-                     'review__istartswith']
+    list_select_related = ['patient__user', 'doctor__user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ['patient__user__first_name__istartswith', 'patient__user__last_name__istartswith',
+                     'doctor__user__first_name__istartswith', 'doctor__user__last_name__istartswith']
     list_filter = ['rating']
 
 @admin.register(models.Payment)
@@ -96,18 +112,31 @@ class PaymentAdmin(admin.ModelAdmin):
     list_display = ['appointment', 'amount', 'paid', 'payment_method']
     list_editable = ['paid']
     list_per_page = 10
-    search_fields = ['appointment__patient__first_name__istartswith',
-                     'appointment__patient__last_name__istartswith',
-                     'appointment__doctor__first_name__istartswith',
-                     'appointment__doctor__last_name__istartswith']
+    list_select_related = ['appointment__patient__user', 'appointment__doctor__user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ['appointment__patient__user__first_name__istartswith',
+                     'appointment__patient__user__last_name__istartswith',
+                     'appointment__doctor__user__first_name__istartswith',
+                     'appointment__doctor__user__last_name__istartswith']
     list_filter = ['paid']
 
 @admin.register(models.MedicalRecord)
 class MedicalRecordAdmin(admin.ModelAdmin):
     list_display = ['prescription', 'symptoms', 'diagnosis']
     list_per_page = 10
-    search_fields = ['prescription__patient__first_name__istartswith',
-                     'prescription__patient__last_name__istartswith',
-                     'prescription__doctor__first_name__istartswith',
-                     'prescription__doctor__last_name__istartswith',
-                     'symptoms__istartswith', 'diagnosis__istartswith']
\ No newline at end of file
+    list_select_related = ['prescription__patient__user', 'prescription__doctor__user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ['prescription__patient__user__first_name__istartswith',
+                     'prescription__patient__user__last_name__istartswith',
+                     'prescription__doctor__user__first_name__istartswith',
+                     'prescription__doctor__user__last_name__istartswith']
+
+@admin.register(models.OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['to', 'subject', 'created_at', 'sent_at', 'attempts']
+    list_per_page = 10
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ['to__istartswith']
@@ -0,0 +1,99 @@
+"""Async read-only doctor and review endpoints.
+
+These mirror the JSON of the sync DRF viewsets but run on the async ORM, so
+under ASGI a slow client holds a coroutine rather than a worker thread. DRF
+views are sync-only, so filtering, paging and rendering are done by hand;
+serializers are reused and never query, since every row is fully joined.
+"""
+from functools import wraps
+
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .filtering import DoctorFilter
+from .images import LIST_IMAGE_WIDTH, DETAIL_IMAGE_WIDTH
+from .models import Doctor, Review
+from .pagination import DefaultPagination
+from .search import search_doctors
+from .serializers import DoctorSerializer, ReviewSerializer
+from .views import DoctorListViewSet
+
+PAGE_SIZE = DefaultPagination.page_size
+
+
+def read_only(view):
+    # django.views.decorators.http wraps async views in a sync function on 4.2.
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _json(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+async def _paginate(request, queryset, serializer_class, context):
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 0
+    count = await queryset.acount()
+    last_page = max((count + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+    if not 1 <= page <= last_page:
+        return _json({'detail': 'Invalid page.'}, status=404)
+    offset = (page - 1) * PAGE_SIZE
+    rows = [row async for row in queryset[offset:offset + PAGE_SIZE]]
+
+    url = request.build_absolute_uri()
+    previous = None
+    if page > 2:
+        previous = replace_query_param(url, 'page', page - 1)
+    elif page == 2:
+        previous = remove_query_param(url, 'page')
+    return _json({
+        'count': count,
+        'next': replace_query_param(url, 'page', page + 1) if page < last_page else None,
+        'previous': previous,
+        'results': serializer_class(rows, many=True, context=context).data,
+    })
+
+
+@read_only
+async def doctor_list(request):
+    queryset = Doctor.objects.select_related('user', 'location', 'user__userimage')
+    filterset = DoctorFilter(request.GET, queryset=queryset)
+    try:
+        if not filterset.is_valid():
+            return _json(filterset.errors, status=400)
+        queryset = search_doctors(filterset.qs, request.GET.get('search', ''))
+    except ValidationError as exc:
+        return _json(exc.detail, status=400)
+    ordering = [field for field in request.GET.get('ordering', '').split(',')
+                if field.lstrip('-') in DoctorListViewSet.ordering_fields]
+    if ordering:
+        queryset = queryset.order_by(*ordering)
+    context = {'request': request, 'image_width': LIST_IMAGE_WIDTH}
+    return await _paginate(request, queryset, DoctorSerializer, context)
+
+
+@read_only
+async def doctor_detail(request, pk):
+    try:
+        doctor = await Doctor.objects.select_related('user', 'location', 'user__userimage').aget(pk=pk)
+    except Doctor.DoesNotExist:
+        return _json({'detail': 'Not found.'}, status=404)
+    context = {'request': request, 'image_width': DETAIL_IMAGE_WIDTH}
+    return _json(DoctorSerializer(doctor, context=context).data)
+
+
+@read_only
+async def doctor_reviews(request, doctor_pk):
+    # Like ReviewViewSet without ?pagination=cursor, the list is not paged.
+    queryset = Review.objects.select_related('patient__user').filter(doctor_id=doctor_pk)
+    reviews = [review async for review in queryset]
+    return _json(ReviewSerializer(reviews, many=True, context={'request': request}).data)
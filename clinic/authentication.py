@@ -0,0 +1,90 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Doctor, Patient
+
+_users = OrderedDict()
+_users_lock = threading.Lock()
+
+
+def token_version(user):
+    """Keyed digest of the password hash; changing the password retires old tokens.
+
+    Tokens are readable by their holder, so the digest is an HMAC under
+    SECRET_KEY rather than a bare hash of the stored password.
+    """
+    return salted_hmac('clinic.authentication.token_version', user.password, algorithm='sha256').hexdigest()[:16]
+
+
+def user_role(user):
+    if Doctor.objects.filter(user=user).exists():
+        return 'doctor'
+    if Patient.objects.filter(user=user).exists():
+        return 'patient'
+    return None
+
+
+def evict_user(user_id):
+    with _users_lock:
+        _users.pop(user_id, None)
+
+
+def _cached_user(user_id, version):
+    with _users_lock:
+        entry = _users.get(user_id)
+        if entry is None:
+            return None
+        cached_version, user, expires = entry
+        if cached_version != version or expires < time.monotonic():
+            del _users[user_id]
+            return None
+        _users.move_to_end(user_id)
+        return user
+
+
+def _cache_user(user, version):
+    with _users_lock:
+        _users[user.pk] = (version, user, time.monotonic() + settings.AUTH_USER_CACHE_TIMEOUT)
+        _users.move_to_end(user.pk)
+        while len(_users) > settings.AUTH_USER_CACHE_SIZE:
+            _users.popitem(last=False)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that serves users from a small in-process LRU cache.
+
+    Entries are keyed by user id and the token's ver claim and live for
+    AUTH_USER_CACHE_TIMEOUT seconds, so the common request authenticates
+    without a query. Saving or deleting a user evicts it in this process;
+    other processes keep accepting their cached copy, including a changed
+    password or is_active=False, until the entry expires.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        if validated_token.get('is_active') is False:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        version = validated_token.get('ver')
+
+        user = _cached_user(user_id, version)
+        if user is None:
+            user = super().get_user(validated_token)
+            if version is not None and version != token_version(user):
+                raise AuthenticationFailed(_('Token is no longer valid'), code='token_not_valid')
+            _cache_user(user, version)
+        elif not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        # Hand out a copy so a view changing request.user cannot touch the cache.
+        return copy.copy(user)
@@ -0,0 +1,90 @@
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Appointment, WorkingHours
+
+AVAILABILITY_TIMEOUT = 60 * 60
+MAX_AVAILABILITY_DAYS = 31
+
+
+def _version_key(doctor_id):
+    return f'availability:{doctor_id}:version'
+
+
+def _day_key(doctor_id, version, day):
+    return f'availability:{doctor_id}:{version}:{day}'
+
+
+def _get_version(doctor_id):
+    return cache.get_or_set(_version_key(doctor_id), time.time_ns, timeout=None)
+
+
+def invalidate_doctor(doctor_id):
+    """Drop every cached day of a doctor by moving to a new key version."""
+    try:
+        cache.incr(_version_key(doctor_id))
+    except ValueError:
+        cache.set(_version_key(doctor_id), time.time_ns(), timeout=None)
+
+
+def invalidate_day(doctor_id, day):
+    cache.delete(_day_key(doctor_id, _get_version(doctor_id), day))
+
+
+def _compute_slots(hours, booked, day):
+    # booked holds the day's appointment start times, sorted. An appointment
+    # lasts one slot, so it takes every slot it overlaps, aligned or not.
+    slots = []
+    for working_hours in hours:
+        if working_hours.weekday != day.weekday():
+            continue
+        step = timedelta(minutes=working_hours.slot_minutes)
+        slot = datetime.combine(day, working_hours.start_time)
+        end = datetime.combine(day, working_hours.end_time)
+        while slot + step <= end:
+            index = bisect_right(booked, slot - step)
+            if index == len(booked) or booked[index] >= slot + step:
+                slots.append(slot.time())
+            slot += step
+    return [slot.strftime('%H:%M') for slot in sorted(slots)]
+
+
+def _upcoming(day, slots, now):
+    # Days are cached whole; slots that have started are dropped on each read.
+    if day > now.date():
+        return slots
+    if day < now.date():
+        return []
+    current = now.strftime('%H:%M')
+    return [slot for slot in slots if slot > current]
+
+
+def get_free_slots(doctor_id, start, end):
+    """Return the free slots of a doctor for every day from start to end inclusive.
+
+    Days missing from the cache are computed together from the doctor's
+    working hours and a single range query over their appointments. Slots
+    that have already started are never offered.
+    """
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    version = _get_version(doctor_id)
+    keys = {day: _day_key(doctor_id, version, day) for day in days}
+    slots = cache.get_many(keys.values())
+    missing = [day for day in days if keys[day] not in slots]
+    if missing:
+        hours = list(WorkingHours.objects.filter(doctor_id=doctor_id))
+        booked = defaultdict(list)
+        appointments = Appointment.objects.filter(doctor_id=doctor_id, date__range=(missing[0], missing[-1])) \
+            .exclude(approval='rejected').order_by('date', 'time').values_list('date', 'time')
+        for day, start_time in appointments:
+            booked[day].append(datetime.combine(day, start_time))
+        computed = {keys[day]: _compute_slots(hours, booked[day], day) for day in missing}
+        cache.set_many(computed, AVAILABILITY_TIMEOUT)
+        slots.update(computed)
+    now = timezone.localtime()
+    return [{'date': day.isoformat(), 'slots': _upcoming(day, slots[keys[day]], now)} for day in days]
@@ -0,0 +1,78 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .replicas import reading_from_replica
+
+VERSION_KEY = 'response-cache:version'
+INVALIDATED_AT_KEY = 'response-cache:invalidated-at'
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_response_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def get_cache_stats():
+    """Return this process's hit and miss counters."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _record(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def invalidate_responses():
+    """Make every cached response stale by moving to a new key version."""
+    cache = get_response_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    cache.set(INVALIDATED_AT_KEY, time.time(), timeout=None)
+
+
+def _replica_may_be_stale(cache):
+    # A lagging replica could still return the rows the invalidation was for.
+    if not reading_from_replica():
+        return False
+    return time.time() - cache.get(INVALIDATED_AT_KEY, 0) < settings.REPLICA_LAG_SECONDS
+
+
+def cached_response(request, handler, *args, **kwargs):
+    """Serve the response data of a GET from the cache, filling it on a miss.
+
+    Keys cover the absolute URI, so every page, filter and host gets its own
+    entry. Only response.data is stored; it is rendered again per request.
+    """
+    cache = get_response_cache()
+    version = cache.get_or_set(VERSION_KEY, time.time_ns, timeout=None)
+    uri = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    key = f'response-cache:{version}:{uri}'
+    data = cache.get(key)
+    if data is not None:
+        _record('hits')
+        return Response(data)
+    _record('misses')
+    response = handler(request, *args, **kwargs)
+    if response.status_code == 200 and not _replica_may_be_stale(cache):
+        cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+    return response
+
+
+class CachedListMixin:
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, super().list, *args, **kwargs)
+
+
+class CachedRetrieveMixin:
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(request, super().retrieve, *args, **kwargs)
@@ -0,0 +1,56 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(request, version):
+    """Build a strong ETag from a version stamp and the representation asked for.
+
+    The full path carries the query string (image width and format, pages)
+    and the renderer's media type tells JSON apart from the browsable API.
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    media_type = renderer.media_type if renderer is not None else ''
+    raw = f'{request.get_full_path()}|{media_type}|{version}'
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def row_version(queryset, pk, *fields):
+    """Return the version columns of one row, or None if the pk matches nothing."""
+    try:
+        return queryset.filter(pk=pk).order_by().values_list(*fields).first()
+    except (ValueError, ValidationError):
+        return None
+
+
+def conditional_response(view, request, handler, *args, **kwargs):
+    """Answer If-None-Match with 304 when the view's version stamp still matches.
+
+    get_etag_version() is a single indexed lookup, so unchanged resources are
+    never loaded or serialized. A version of None skips the check and lets the
+    handler report the 404.
+    """
+    version = view.get_etag_version()
+    if version is None:
+        return handler(request, *args, **kwargs)
+    etag = make_etag(request, version)
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    response = handler(request, *args, **kwargs)
+    if response.status_code == status.HTTP_200_OK:
+        response['ETag'] = etag
+    return response
+
+
+class ConditionalListMixin:
+    def list(self, request, *args, **kwargs):
+        return conditional_response(self, request, super().list, *args, **kwargs)
+
+
+class ConditionalRetrieveMixin:
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(self, request, super().retrieve, *args, **kwargs)
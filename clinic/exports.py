@@ -0,0 +1,148 @@
+import csv
+import json
+from datetime import date
+
+from django.db.models import Q
+
+from .models import Appointment, Payment, MedicalRecord
+
+OUTPUT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+CHUNK_SIZE = 2000
+
+# Each export lists (column, lookup) pairs and the lookups its filters use.
+# Rows are read with values_list, so the joins are made in SQL and no model
+# instances are built. 'unpaid_if_missing' names an optional relation whose
+# absence also counts as unpaid.
+EXPORTS = {
+    'appointments': {
+        'model': Appointment,
+        'columns': [
+            ('id', 'id'),
+            ('date', 'date'),
+            ('time', 'time'),
+            ('approval', 'approval'),
+            ('doctor_id', 'doctor_id'),
+            ('doctor_first_name', 'doctor__user__first_name'),
+            ('doctor_last_name', 'doctor__user__last_name'),
+            ('specialization', 'doctor__specialization'),
+            ('patient_id', 'patient_id'),
+            ('patient_first_name', 'patient__user__first_name'),
+            ('patient_last_name', 'patient__user__last_name'),
+            ('patient_email', 'patient__user__email'),
+            ('amount', 'payment__amount'),
+            ('paid', 'payment__paid'),
+        ],
+        'date': 'date',
+        'doctor': 'doctor_id',
+        'paid': 'payment__paid',
+        'unpaid_if_missing': 'payment',
+    },
+    'payments': {
+        'model': Payment,
+        'columns': [
+            ('id', 'id'),
+            ('appointment_id', 'appointment_id'),
+            ('date', 'appointment__date'),
+            ('time', 'appointment__time'),
+            ('doctor_id', 'appointment__doctor_id'),
+            ('doctor_first_name', 'appointment__doctor__user__first_name'),
+            ('doctor_last_name', 'appointment__doctor__user__last_name'),
+            ('patient_id', 'appointment__patient_id'),
+            ('patient_first_name', 'appointment__patient__user__first_name'),
+            ('patient_last_name', 'appointment__patient__user__last_name'),
+            ('amount', 'amount'),
+            ('paid', 'paid'),
+            ('payment_method', 'payment_method'),
+        ],
+        'date': 'appointment__date',
+        'doctor': 'appointment__doctor_id',
+        'paid': 'paid',
+    },
+    'medical-records': {
+        'model': MedicalRecord,
+        'columns': [
+            ('id', 'id'),
+            ('prescription_id', 'prescription_id'),
+            ('date', 'prescription__date'),
+            ('doctor_id', 'prescription__doctor_id'),
+            ('doctor_first_name', 'prescription__doctor__user__first_name'),
+            ('doctor_last_name', 'prescription__doctor__user__last_name'),
+            ('patient_id', 'prescription__patient_id'),
+            ('patient_first_name', 'prescription__patient__user__first_name'),
+            ('patient_last_name', 'prescription__patient__user__last_name'),
+            ('prescription', 'prescription__prescription'),
+            ('symptoms', 'symptoms'),
+            ('diagnosis', 'diagnosis'),
+        ],
+        'date': 'prescription__date',
+        'doctor': 'prescription__doctor_id',
+    },
+}
+
+
+def _parse_date(name, value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'"{name}" must be a date in YYYY-MM-DD format.')
+
+
+def export_rows(name, date_from=None, date_to=None, doctor=None, paid=None):
+    """Return (columns, rows) for an export, with rows read in chunks from the database.
+
+    Filters come as strings, from query parameters or command options;
+    invalid ones raise ValueError with a message for the client.
+    """
+    if name not in EXPORTS:
+        raise ValueError(f'Unknown export "{name}". Choose from: {", ".join(EXPORTS)}.')
+    export = EXPORTS[name]
+    filters = Q()
+    if date_from:
+        filters &= Q(**{f'{export["date"]}__gte': _parse_date('from', date_from)})
+    if date_to:
+        filters &= Q(**{f'{export["date"]}__lte': _parse_date('to', date_to)})
+    if doctor:
+        if not doctor.isdigit():
+            raise ValueError('"doctor" must be a doctor id.')
+        filters &= Q(**{export['doctor']: int(doctor)})
+    if paid:
+        if 'paid' not in export:
+            raise ValueError(f'The {name} export cannot be filtered by "paid".')
+        if paid not in ('paid', 'unpaid'):
+            raise ValueError('"paid" must be "paid" or "unpaid".')
+        condition = Q(**{export['paid']: paid})
+        if paid == 'unpaid' and 'unpaid_if_missing' in export:
+            condition |= Q(**{f'{export["unpaid_if_missing"]}__isnull': True})
+        filters &= condition
+
+    columns = [column for column, _ in export['columns']]
+    lookups = [lookup for _, lookup in export['columns']]
+    # Ordering by the primary key keeps the scan on an index and the output stable.
+    queryset = export['model'].objects.filter(filters).order_by('pk').values_list(*lookups)
+    return columns, queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def render_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_jsonl(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=str) + '\n'
+
+
+RENDERERS = {
+    'csv': render_csv,
+    'jsonl': render_jsonl,
+}
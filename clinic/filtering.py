@@ -1,10 +1,122 @@
-from django_filters.rest_framework import FilterSet
+import math
+
+from django.db.models import Case, CharField, Count, F, FloatField, ExpressionWrapper, Q, Value, When
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+from django_filters.rest_framework import FilterSet, CharFilter
+from rest_framework.exceptions import ValidationError
 from .models import Doctor
 
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.045
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 500
+
+FACET_FIELDS = {
+    'specialization': 'specialization',
+    'city': 'location__city',
+}
+CHARGES_BANDS = (
+    (None, 1000),
+    (1000, 2500),
+    (2500, 5000),
+    (5000, None),
+)
+
+
+def haversine_km(lat, lng, lat_field='location__lat', lng_field='location__lng'):
+    lat2 = Radians(Cast(F(lat_field), FloatField()))
+    lng2 = Radians(Cast(F(lng_field), FloatField()))
+    lat1 = math.radians(lat)
+    lng1 = math.radians(lng)
+    a = Power(Sin((lat2 - lat1) / 2), 2) + \
+        math.cos(lat1) * Cos(lat2) * Power(Sin((lng2 - lng1) / 2), 2)
+    return ExpressionWrapper(2 * EARTH_RADIUS_KM * ASin(Sqrt(a)), output_field=FloatField())
+
+
+def bounding_box(lat, lng, radius_km):
+    lat_delta = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(lat))
+    lng_delta = 180 if cos_lat < 1e-6 else min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180)
+    return lat - lat_delta, lat + lat_delta, lng - lng_delta, lng + lng_delta
+
+
+def _band_label(low, high):
+    if low is None:
+        return f'<{high}'
+    if high is None:
+        return f'{low}+'
+    return f'{low}-{high}'
+
+
+def charges_band():
+    whens = []
+    for low, high in CHARGES_BANDS:
+        condition = Q()
+        if low is not None:
+            condition &= Q(charges__gte=low)
+        if high is not None:
+            condition &= Q(charges__lt=high)
+        whens.append(When(condition, then=Value(_band_label(low, high))))
+    return Case(*whens, output_field=CharField())
+
+
+def get_facets(queryset, names):
+    """Count the doctors of a filtered queryset per value of each named facet.
+
+    Every facet is a single GROUP BY over the same filters, search and
+    radius as the listing itself.
+    """
+    unknown = [name for name in names if name not in FACET_FIELDS and name != 'charges_band']
+    if unknown:
+        raise ValidationError({'facets': f'Unknown facets: {", ".join(unknown)}.'})
+    queryset = queryset.order_by()
+    facets = {}
+    for name in names:
+        if name == 'charges_band':
+            rows = queryset.annotate(value=charges_band()).values('value')
+        else:
+            rows = queryset.values(value=F(FACET_FIELDS[name]))
+        rows = rows.annotate(count=Count('pk')).order_by('-count', 'value')
+        facets[name] = [{'value': row['value'], 'count': row['count']} for row in rows]
+    return facets
+
+
 class DoctorFilter(FilterSet):
+    near = CharFilter(method='filter_near')
+
     class Meta:
         model = Doctor
         fields = {
             'specialization': ['iexact'],
             'charges': ['gte', 'lte'],
-        }
\ No newline at end of file
+            'rating_avg': ['gte', 'lte'],
+        }
+
+    def filter_near(self, queryset, name, value):
+        try:
+            lat, lng = (float(part) for part in value.split(','))
+        except ValueError:
+            raise ValidationError({'near': 'Expected "lat,lng".'})
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValidationError({'near': 'Coordinates are out of range.'})
+        try:
+            radius_km = float(self.data.get('radius_km', DEFAULT_RADIUS_KM))
+        except ValueError:
+            raise ValidationError({'radius_km': 'Expected a number.'})
+        if not 0 < radius_km <= MAX_RADIUS_KM:
+            raise ValidationError({'radius_km': f'Must be between 0 and {MAX_RADIUS_KM}.'})
+
+        # The bounding box runs on the indexed (lat, lng) columns so only
+        # nearby rows reach the exact haversine distance.
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+        queryset = queryset.filter(location__lat__range=(min_lat, max_lat))
+        if max_lng - min_lng < 360:
+            # Boxes crossing the antimeridian wrap into two longitude ranges.
+            if min_lng < -180:
+                queryset = queryset.filter(Q(location__lng__gte=min_lng + 360) | Q(location__lng__lte=max_lng))
+            elif max_lng > 180:
+                queryset = queryset.filter(Q(location__lng__gte=min_lng) | Q(location__lng__lte=max_lng - 360))
+            else:
+                queryset = queryset.filter(location__lng__range=(min_lng, max_lng))
+        return queryset.annotate(distance=haversine_km(lat, lng)) \
+            .filter(distance__lte=radius_km).order_by('distance')
@@ -0,0 +1,138 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .models import UserImage
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (64, 128, 256, 512)
+THUMBNAIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+DEFAULT_THUMBNAIL_FORMAT = 'webp'
+MAX_IMAGE_DIMENSION = 2048
+LIST_IMAGE_WIDTH = 128
+DETAIL_IMAGE_WIDTH = 512
+QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # Created on first use so forked server workers do not share one pool.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_PROCESSING_WORKERS,
+                                           thread_name_prefix='user-image')
+        return _executor
+
+
+def schedule_image_processing(user_image):
+    """Process an uploaded image on the worker pool once the upload commits."""
+    pk = user_image.pk
+    transaction.on_commit(lambda: _get_executor().submit(_run, pk))
+
+
+def _run(pk):
+    try:
+        process_user_image(pk)
+    except Exception:
+        logger.exception('Processing user image %s failed', pk)
+    finally:
+        connection.close()
+
+
+def stored_names(image_name, thumbnails):
+    """Return the storage names of an image and all of its thumbnails."""
+    names = {name for variants in thumbnails.values() for name in variants.values()}
+    if image_name:
+        names.add(image_name)
+    return names
+
+
+def delete_stored(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def _encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = io.BytesIO()
+    # Nothing is copied from the source info, so EXIF and other metadata are dropped.
+    image.save(buffer, image_format, quality=QUALITY, optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def process_user_image(pk):
+    """Strip metadata, bound the size of the original and write thumbnails.
+
+    The result is only stored if the row still holds the image that was
+    read; a newer upload wins, and the files written here are removed.
+    """
+    try:
+        user_image = UserImage.objects.get(pk=pk)
+    except UserImage.DoesNotExist:
+        return
+    if not user_image.image:
+        return
+
+    with user_image.image.open('rb') as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    image.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.LANCZOS)
+
+    old_name = user_image.image.name
+    base = os.path.splitext(os.path.basename(old_name))[0]
+    original_format = 'PNG' if image.mode == 'RGBA' else 'JPEG'
+    original_name = default_storage.save(
+        f'users/images/{base}.{original_format.lower()}', _encode(image, original_format))
+
+    thumbnails = {}
+    for extension, image_format in THUMBNAIL_FORMATS.items():
+        thumbnails[extension] = {}
+        for width in THUMBNAIL_WIDTHS:
+            if width >= image.width:
+                break
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            name = default_storage.save(f'users/images/thumbnails/{base}_{width}.{extension}',
+                                        _encode(resized, image_format))
+            thumbnails[extension][str(width)] = name
+
+    with transaction.atomic():
+        current = UserImage.objects.select_for_update().filter(pk=pk, image=old_name).first()
+        if current is not None:
+            # The post_save receiver removes the replaced original and thumbnails.
+            current.image.name = original_name
+            current.thumbnails = thumbnails
+            current.save(update_fields=['image', 'thumbnails'])
+    if current is None:
+        delete_stored(stored_names(original_name, thumbnails))
+
+
+def pick_variant(user_image, width, image_format=DEFAULT_THUMBNAIL_FORMAT):
+    """Return the storage name of the smallest variant at least `width` wide.
+
+    Falls back to the original when no thumbnail is wide enough or the image
+    has not been processed yet.
+    """
+    variants = user_image.thumbnails.get(image_format) or {}
+    for variant_width in sorted(variants, key=int):
+        if int(variant_width) >= width:
+            return variants[variant_width]
+    return user_image.image.name
@@ -0,0 +1,195 @@
+import csv
+import json
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
+from django.db import transaction
+from rest_framework import serializers
+
+from .caching import invalidate_responses
+from .mail import verification_email
+from .models import User, Location, Doctor, Patient, DoctorSearchTerm, OutgoingEmail, \
+    GENDER_CHOICES, APPROVAL_CHOICES
+from .search import build_search_terms
+
+ROLES = ('doctor', 'patient')
+
+
+class UserRowSerializer(serializers.Serializer):
+    email = serializers.EmailField()
+    phone_number = serializers.CharField(max_length=20)
+    first_name = serializers.CharField(max_length=150)
+    last_name = serializers.CharField(max_length=150)
+    gender = serializers.ChoiceField(choices=GENDER_CHOICES)
+    password = serializers.CharField()
+
+
+class DoctorRowSerializer(UserRowSerializer):
+    specialization = serializers.CharField(max_length=255)
+    charges = serializers.DecimalField(max_digits=8, decimal_places=2, validators=[MinValueValidator(1)])
+    approval_status = serializers.ChoiceField(choices=APPROVAL_CHOICES, default='pending')
+    lat = serializers.DecimalField(max_digits=9, decimal_places=6, min_value=-90, max_value=90)
+    lng = serializers.DecimalField(max_digits=9, decimal_places=6, min_value=-180, max_value=180)
+    address = serializers.CharField(max_length=255)
+    city = serializers.CharField(max_length=255)
+    state = serializers.CharField(max_length=255)
+
+
+class PatientRowSerializer(UserRowSerializer):
+    birth_date = serializers.DateField()
+
+
+ROW_SERIALIZERS = {
+    'doctor': DoctorRowSerializer,
+    'patient': PatientRowSerializer,
+}
+
+
+def read_rows(file, file_format):
+    """Yield (line number, row) pairs from a CSV or JSON Lines file, one line at a time.
+
+    A JSON line that does not parse is yielded as the decoding error.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            row.pop(None, None)
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as exc:
+            yield line_number, exc
+
+
+def init_hash_worker():
+    # Spawned workers start without Django; forked ones already have it.
+    django.setup()
+
+
+def _is_hashed(password):
+    try:
+        identify_hasher(password)
+    except ValueError:
+        return False
+    return True
+
+
+def hash_passwords(passwords, executor):
+    """Hash raw passwords on the executor, keeping values that are already Django hashes."""
+    passwords = list(passwords)
+    pending = [index for index, password in enumerate(passwords) if not _is_hashed(password)]
+    hashed = executor.map(make_password, [passwords[index] for index in pending], chunksize=16)
+    for index, password in zip(pending, hashed):
+        passwords[index] = password
+    return passwords
+
+
+def _format_errors(detail):
+    if isinstance(detail, dict):
+        return '; '.join(f'{field}: {" ".join(str(message) for message in messages)}'
+                         for field, messages in detail.items())
+    return ' '.join(str(message) for message in detail)
+
+
+def _validate(rows, role):
+    # One serializer validates every row, as ListSerializer does, instead
+    # of building a fresh set of fields per row.
+    serializer = ROW_SERIALIZERS[role]()
+    valid, errors = [], []
+    for line_number, data in rows:
+        if isinstance(data, Exception):
+            errors.append((line_number, str(data)))
+            continue
+        try:
+            row = serializer.run_validation(data)
+        except serializers.ValidationError as exc:
+            errors.append((line_number, _format_errors(exc.detail)))
+            continue
+        row['email'] = User.objects.normalize_email(row['email'])
+        # Raw passwords meet AUTH_PASSWORD_VALIDATORS, as they would through
+        # the API; existing hashes cannot be checked and are taken as given.
+        if not _is_hashed(row['password']):
+            user = User(email=row['email'], first_name=row['first_name'], last_name=row['last_name'],
+                        phone_number=row['phone_number'])
+            try:
+                validate_password(row['password'], user)
+            except ValidationError as exc:
+                errors.append((line_number, 'password: ' + ' '.join(exc.messages)))
+                continue
+        valid.append((line_number, row))
+
+    # One query per column checks the whole batch against existing users.
+    emails = User.objects.filter(email__in=[row['email'] for _, row in valid])
+    phones = User.objects.filter(phone_number__in=[row['phone_number'] for _, row in valid])
+    taken_emails = set(emails.values_list('email', flat=True))
+    taken_phones = set(phones.values_list('phone_number', flat=True))
+    unique = []
+    for line_number, row in valid:
+        if row['email'] in taken_emails:
+            errors.append((line_number, f'A user with email {row["email"]} already exists.'))
+        elif row['phone_number'] in taken_phones:
+            errors.append((line_number, f'A user with phone number {row["phone_number"]} already exists.'))
+        else:
+            taken_emails.add(row['email'])
+            taken_phones.add(row['phone_number'])
+            unique.append(row)
+    errors.sort(key=lambda error: error[0])
+    return unique, errors
+
+
+def import_batch(rows, role, executor):
+    """Validate one batch of rows and insert the valid ones with bulk_create.
+
+    Returns (created, errors), where errors is a list of (line number,
+    message). Users are created inactive with a queued verification email,
+    the same as users registering through the API.
+    """
+    rows, errors = _validate(rows, role)
+    passwords = hash_passwords([row['password'] for row in rows], executor)
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(email=row['email'], phone_number=row['phone_number'], first_name=row['first_name'],
+                 last_name=row['last_name'], gender=row['gender'], password=password, is_active=False)
+            for row, password in zip(rows, passwords)
+        ])
+        if role == 'doctor':
+            locations = Location.objects.bulk_create([
+                Location(lat=row['lat'], lng=row['lng'], address=row['address'],
+                         city=row['city'], state=row['state'])
+                for row in rows
+            ])
+            doctors = Doctor.objects.bulk_create([
+                Doctor(user=user, location=location, specialization=row['specialization'],
+                       charges=row['charges'], approval_status=row['approval_status'])
+                for row, user, location in zip(rows, users, locations)
+            ])
+            # bulk_create skips post_save, so index the new doctors here.
+            DoctorSearchTerm.objects.bulk_create([
+                term for doctor in doctors for term in build_search_terms(doctor)
+            ])
+            transaction.on_commit(invalidate_responses)
+        else:
+            Patient.objects.bulk_create([
+                Patient(user=user, birth_date=row['birth_date'])
+                for row, user in zip(rows, users)
+            ])
+        OutgoingEmail.objects.bulk_create([verification_email(user) for user in users])
+    return len(users), errors
+
+
+def import_rows(rows, role, executor, batch_size=1000):
+    """Import (line number, row) pairs batch by batch, yielding each batch's result."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield len(batch), import_batch(batch, role, executor)
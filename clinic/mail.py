@@ -0,0 +1,92 @@
+from datetime import date, timedelta
+
+import environ
+import jwt
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+MAX_ATTEMPTS = 5
+UPDATE_FIELDS = ['attempts', 'sent_at', 'next_attempt_at', 'last_error']
+
+env = environ.Env()
+
+
+def verification_email(user):
+    """Build the unsaved verification message for a newly registered user."""
+    token = jwt.encode({
+        'user_id': user.id,
+        'created_at': str(date.today()),
+        'is_active': user.is_active,
+    }, key='secret')
+    return OutgoingEmail(
+        subject='Email Verification',
+        body=f'Please verify your email by clicking on the link below:\n{env("BASE_CLIENT_URL")}/?token={token}',
+        to=user.email,
+    )
+
+
+def queue_verification_mail(user):
+    """Write the verification message to the outbox for send_queued_mail.
+
+    It is saved in the caller's transaction, so it is only sent if the
+    registration commits.
+    """
+    email = verification_email(user)
+    email.save()
+    return email
+
+
+def _mark_failed(email, exc, now):
+    email.attempts += 1
+    email.last_error = str(exc)
+    email.next_attempt_at = now + timedelta(minutes=2 ** email.attempts)
+
+
+def send_queued_mail(batch_size=100, max_attempts=MAX_ATTEMPTS):
+    """Send one batch of pending mail over a single connection.
+
+    Returns a (sent, failed) tuple. Rows are locked with SKIP LOCKED, so
+    several workers can drain the outbox side by side. Failed messages are
+    retried with exponential backoff until max_attempts is reached.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(sent_at__isnull=True, attempts__lt=max_attempts)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .order_by('id')[:batch_size]
+        )
+        if not emails:
+            return 0, 0
+
+        sent = failed = 0
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as exc:
+            for email in emails:
+                _mark_failed(email, exc, now)
+            OutgoingEmail.objects.bulk_update(emails, UPDATE_FIELDS)
+            return 0, len(emails)
+        try:
+            for email in emails:
+                try:
+                    EmailMessage(email.subject, email.body, email.from_email or None, [email.to],
+                                 connection=connection).send()
+                except Exception as exc:
+                    _mark_failed(email, exc, now)
+                    failed += 1
+                else:
+                    email.attempts += 1
+                    email.sent_at = timezone.now()
+                    email.last_error = ''
+                    sent += 1
+        finally:
+            connection.close()
+            OutgoingEmail.objects.bulk_update(emails, UPDATE_FIELDS)
+    return sent, failed
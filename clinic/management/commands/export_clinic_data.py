@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic.exports import EXPORTS, RENDERERS, export_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream appointments, payments or medical records as CSV or JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument('--output', choices=list(RENDERERS), default='csv')
+        parser.add_argument('--file', help='Write to this path instead of standard output.')
+        parser.add_argument('--from', dest='date_from', help='First date to include, YYYY-MM-DD.')
+        parser.add_argument('--to', dest='date_to', help='Last date to include, YYYY-MM-DD.')
+        parser.add_argument('--doctor', help='Only include this doctor id.')
+        parser.add_argument('--paid', choices=['paid', 'unpaid'])
+
+    def handle(self, *args, **options):
+        try:
+            columns, rows = export_rows(options['name'], options['date_from'], options['date_to'],
+                                        options['doctor'], options['paid'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        chunks = RENDERERS[options['output']](columns, rows)
+        if options['file']:
+            with open(options['file'], 'w', encoding='utf-8', newline='') as file:
+                file.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,50 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic.imports import ROLES, import_rows, init_hash_worker, read_rows
+
+
+class Command(BaseCommand):
+    help = ('Bulk import doctors (with their locations) or patients from a CSV or JSON Lines file. '
+            'Passwords may be given raw or as existing Django password hashes; raw passwords must '
+            'pass AUTH_PASSWORD_VALIDATORS, existing hashes are imported without validation.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--role', choices=ROLES, required=True)
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes used to hash passwords.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format not in ('csv', 'jsonl'):
+            raise CommandError('Cannot tell the file format; pass --format csv or --format jsonl.')
+
+        processed = created = failed = 0
+        started = time.monotonic()
+        try:
+            file = open(options['path'], encoding='utf-8-sig', newline='')
+        except OSError as exc:
+            raise CommandError(exc)
+        with file, ProcessPoolExecutor(options['workers'], initializer=init_hash_worker) as executor:
+            rows = read_rows(file, file_format)
+            for count, (batch_created, errors) in import_rows(rows, options['role'], executor,
+                                                              options['batch_size']):
+                processed += count
+                created += batch_created
+                failed += len(errors)
+                for line_number, error in errors:
+                    self.stderr.write(f'Line {line_number}: {error}')
+                rate = processed / (time.monotonic() - started)
+                self.stdout.write(f'{processed} rows read, {created} created, {failed} rejected '
+                                  f'({rate:.0f} rows/s)')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {created} of {processed} rows in {elapsed:.1f}s.'))
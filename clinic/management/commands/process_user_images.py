@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from clinic.images import process_user_image
+from clinic.models import UserImage
+
+
+class Command(BaseCommand):
+    help = ('Process profile images that have no thumbnails yet, such as uploads whose job was lost '
+            'when the server restarted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess every image.')
+
+    def handle(self, *args, **options):
+        images = UserImage.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            images = images.filter(thumbnails={})
+        processed = 0
+        for pk in images.order_by('pk').values_list('pk', flat=True).iterator():
+            process_user_image(pk)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images.'))
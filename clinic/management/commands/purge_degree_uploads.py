@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from clinic.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete degree uploads, and their files, that were not used within the allowed age.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=settings.DEGREE_UPLOAD_MAX_AGE_HOURS,
+                            help='Age after which an upload is considered abandoned.')
+
+    def handle(self, *args, **options):
+        purged = purge_stale_uploads(options['hours'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} degree uploads.'))
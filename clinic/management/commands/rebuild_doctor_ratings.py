@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from clinic.ratings import rebuild_doctor_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored rating average and count of every doctor from their reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = rebuild_doctor_ratings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings for {updated} reviewed doctors.'))
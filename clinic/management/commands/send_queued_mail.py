@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from clinic.mail import send_queued_mail, MAX_ATTEMPTS
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending messages from the outgoing email queue in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the queue instead of exiting once it is empty.')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to sleep between polls when the queue is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_queued_mail(options['batch_size'], options['max_attempts'])
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} messages, {failed} failed.')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,225 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.utils.crypto import constant_time_compare
+from rest_framework.permissions import BasePermission
+from rest_framework.serializers import ListSerializer
+
+from .caching import get_cache_stats
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Statements kept per request for the slow request log.
+MAX_LOGGED_QUERIES = 50
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Total time spent on the request.', SECONDS_BUCKETS),
+    'http_request_db_queries': ('Database queries run by the request.', QUERY_BUCKETS),
+    'http_request_db_duration_seconds': ('Time spent waiting on the database.', SECONDS_BUCKETS),
+    'http_request_render_duration_seconds': ('Time spent rendering the response body.', SECONDS_BUCKETS),
+    'http_request_serializer_duration_seconds': ('Time spent building serializer.data.', SECONDS_BUCKETS),
+}
+
+_histograms = {}
+_requests = {}
+_lock = threading.Lock()
+
+
+def _observe(name, labels, value):
+    key = (name, labels)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms.setdefault(key, Histogram(HISTOGRAMS[name][1]))
+    histogram.observe(value)
+
+
+def record(route, method, status, duration, queries, db_duration, render_duration, serializer_duration=None):
+    labels = (('route', route), ('method', method))
+    with _lock:
+        _observe('http_request_duration_seconds', labels, duration)
+        _observe('http_request_db_queries', labels, queries)
+        _observe('http_request_db_duration_seconds', labels, db_duration)
+        if render_duration is not None:
+            _observe('http_request_render_duration_seconds', labels, render_duration)
+        if serializer_duration is not None:
+            _observe('http_request_serializer_duration_seconds', labels, serializer_duration)
+        key = (*labels, ('status', str(status)))
+        _requests[key] = _requests.get(key, 0) + 1
+
+
+def _format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+def render_metrics():
+    """Return this process's metrics in the Prometheus text exposition format."""
+    lines = ['# HELP http_requests_total Requests served, by route and status.',
+             '# TYPE http_requests_total counter']
+    with _lock:
+        lines.extend(f'http_requests_total{{{_format_labels(labels)}}} {count}'
+                     for labels, count in sorted(_requests.items()))
+        for name, (description, _) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} histogram')
+            for (metric, labels), histogram in sorted(_histograms.items()):
+                if metric != name:
+                    continue
+                label_text = _format_labels(labels)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{{label_text}}} {histogram.sum}')
+                lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+    stats = get_cache_stats()
+    lines.extend([
+        '# HELP response_cache_requests_total Response cache lookups, by outcome.',
+        '# TYPE response_cache_requests_total counter',
+        f'response_cache_requests_total{{outcome="hit"}} {stats["hits"]}',
+        f'response_cache_requests_total{{outcome="miss"}} {stats["misses"]}',
+    ])
+    return '\n'.join(lines) + '\n'
+
+
+class HasMetricsToken(BasePermission):
+    """Let a scraper in with 'Authorization: Bearer <METRICS_TOKEN>'."""
+
+    def has_permission(self, request, view):
+        token = settings.METRICS_TOKEN
+        return bool(token) and constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+
+
+class TimedDataMixin:
+    """Serializer mixin adding the time spent in .data to the request's serializer time.
+
+    Queries run while serializing are counted here as well as in the DB time.
+    """
+
+    @property
+    def data(self):
+        started = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            request = self.context.get('request')
+            if request is not None:
+                # DRF wraps the HttpRequest that the middleware sees.
+                request = getattr(request, '_request', request)
+                request._metrics_serializer_duration = (getattr(request, '_metrics_serializer_duration', 0)
+                                                        + time.perf_counter() - started)
+
+
+class TimedListSerializer(TimedDataMixin, ListSerializer):
+    """list_serializer_class for timed serializers, so many=True is timed once for the whole page."""
+
+
+class _QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if len(self.statements) < MAX_LOGGED_QUERIES:
+                self.statements.append((duration, sql))
+
+    def install(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+class MetricsMiddleware:
+    """Record latency, query count, DB, render and serializer time per resolved route.
+
+    Place it first in MIDDLEWARE so the whole stack is timed. Requests
+    slower than METRICS_SLOW_REQUEST_MS are logged with their SQL. It runs
+    natively under ASGI so async views are not pushed onto a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = _QueryRecorder()
+        started = time.perf_counter()
+        with recorder.install():
+            response = self.get_response(request)
+        self.finish(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        recorder = _QueryRecorder()
+        started = time.perf_counter()
+        with recorder.install():
+            response = await self.get_response(request)
+        self.finish(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    def finish(self, request, response, recorder, duration):
+        match = request.resolver_match
+        route = match.view_name if match is not None else 'unmatched'
+        record(route, request.method, response.status_code, duration,
+               recorder.count, recorder.duration, getattr(request, '_metrics_render_duration', None),
+               getattr(request, '_metrics_serializer_duration', None))
+
+        if duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+            logger.warning(
+                'Slow request %s %s (%s): %.0f ms, %d queries, %.0f ms in the database\n%s',
+                request.method, request.get_full_path(), route, duration * 1000,
+                recorder.count, recorder.duration * 1000,
+                '\n'.join(f'  {sql_duration * 1000:.1f} ms: {sql}' for sql_duration, sql in recorder.statements))
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns; time that step too.
+        render = response.render
+
+        def timed_render():
+            started = time.perf_counter()
+            try:
+                return render()
+            finally:
+                request._metrics_render_duration = time.perf_counter() - started
+
+        response.render = timed_render
+        return response
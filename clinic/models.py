@@ -1,9 +1,14 @@
+import uuid
+
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.contrib import admin
-from django.core.validators import MinValueValidator, FileExtensionValidator
+from django.core.validators import MinValueValidator, MaxValueValidator, FileExtensionValidator
 from .managers import UserManager
-from .validators import validate_file_size
+from .validators import validate_file_size, MAX_FILE_SIZE
 
 APPROVAL_CHOICES = (
     ('approved', 'Approved'),
@@ -17,11 +22,36 @@ GENDER_CHOICES = (
     ('Other', 'Other'),
 )
 
+WEEKDAY_CHOICES = (
+    (0, 'Monday'),
+    (1, 'Tuesday'),
+    (2, 'Wednesday'),
+    (3, 'Thursday'),
+    (4, 'Friday'),
+    (5, 'Saturday'),
+    (6, 'Sunday'),
+)
+
 PAYEMENT_CHOICES = (
     ('paid', 'Paid'),
     ('unpaid', 'Unpaid'),
 )
 
+
+class PatternOpsIndex(models.Index):
+    """Functional index built with text_pattern_ops on PostgreSQL.
+
+    The operator class lets UPPER(col) LIKE 'PREFIX%' use the index. Other
+    backends have no operator classes and get the bare expressions.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+        index = models.Index(*(OpClass(expression, name='text_pattern_ops') for expression in self.expressions),
+                             name=self.name, db_tablespace=self.db_tablespace, condition=self.condition)
+        return index.create_sql(model, schema_editor, using=using, **kwargs)
+
     
 class User(AbstractUser):
     username = None
@@ -32,14 +62,34 @@ class User(AbstractUser):
     REQUIRED_FIELDS = []
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['first_name', 'last_name'], name='user_name_idx'),
+            # Admin name search runs UPPER(name) LIKE 'PREFIX%'; text_pattern_ops
+            # lets PostgreSQL answer it from the index.
+            PatternOpsIndex(Upper('first_name'), name='user_first_name_upper_idx'),
+            PatternOpsIndex(Upper('last_name'), name='user_last_name_upper_idx'),
+        ]
+
 class UserImage(models.Model):
     image = models.ImageField(upload_to='users/images', null=True, blank=True, validators=[validate_file_size])
+    thumbnails = models.JSONField(default=dict, blank=True)
     user = models.OneToOneField(User, on_delete=models.CASCADE)
 
 class DoctorDegree(models.Model):
     degree = models.FileField(upload_to='doctors/degrees', null=True, blank=True,
                                validators=[validate_file_size, FileExtensionValidator(allowed_extensions=['pdf'])])
     doctor = models.OneToOneField('Doctor', on_delete=models.CASCADE, related_name='degree_document')
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+
+class DegreeUpload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    size = models.PositiveIntegerField(validators=[MinValueValidator(1), MaxValueValidator(MAX_FILE_SIZE)])
+    offset = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    degree = models.FileField(upload_to='doctors/degrees', blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
     
 class Doctor(models.Model):
     specialization = models.CharField(max_length=255)
@@ -49,7 +99,12 @@ class Doctor(models.Model):
                                   validators=[MinValueValidator(1)])
     approval_status = models.CharField(
         max_length=20, choices=APPROVAL_CHOICES, default='pending')
+    rating_avg = models.FloatField(default=0, db_index=True)
+    rating_count = models.PositiveIntegerField(default=0)
     user = models.OneToOneField(User, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Version of the doctor's review list, moved by update_doctor_rating.
+    reviews_updated_at = models.DateTimeField(default=timezone.now, editable=False)
     user.user_type = 'doctor'
 
     @admin.display(ordering='user__first_name')
@@ -76,11 +131,32 @@ class Doctor(models.Model):
         verbose_name = 'Doctor'
         verbose_name_plural = 'Doctors'
         ordering = ['user__first_name', 'user__last_name']
+        indexes = [
+            # specialization__iexact and __istartswith compare UPPER(specialization)
+            # on PostgreSQL; text_pattern_ops serves both = and LIKE 'PREFIX%'.
+            PatternOpsIndex(Upper('specialization'), name='doctor_spec_upper_idx'),
+            models.Index(fields=['charges'], name='doctor_charges_idx'),
+            models.Index(fields=['approval_status'], name='doctor_approval_status_idx'),
+        ]
+
+
+class DoctorSearchTerm(models.Model):
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [
+            # varchar_pattern_ops lets PostgreSQL serve LIKE 'prefix%' from the index.
+            models.Index(fields=['term'], name='doctorsearchterm_term_idx',
+                         opclasses=['varchar_pattern_ops']),
+        ]
 
 
 class Patient(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     birth_date = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     @admin.display(ordering='user__first_name')
     def first_name(self):
@@ -122,6 +198,26 @@ class Location(models.Model):
         verbose_name = 'Location'
         verbose_name_plural = 'Locations'
         ordering = ['city', 'state']
+        indexes = [
+            models.Index(fields=['lat', 'lng'], name='location_lat_lng_idx'),
+            models.Index(fields=['city', 'state'], name='location_city_state_idx'),
+        ]
+
+
+class WorkingHours(models.Model):
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='working_hours')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30, validators=[MinValueValidator(5)])
+
+    def __str__(self):
+        return f"{self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+    class Meta:
+        verbose_name = 'Working Hours'
+        verbose_name_plural = 'Working Hours'
+        ordering = ['weekday', 'start_time']
 
 
 class Appointment(models.Model):
@@ -141,9 +237,18 @@ class Appointment(models.Model):
         constraints = [
             models.UniqueConstraint(
                 fields=['patient', 'doctor', 'date', 'time'], name='unique_appointment'
-            )
+            ),
+            models.UniqueConstraint(
+                fields=['doctor', 'date', 'time'], condition=~models.Q(approval='rejected'),
+                name='unique_active_doctor_slot'
+            ),
         ]
         ordering = ['date', 'time']
+        indexes = [
+            models.Index(fields=['doctor', 'date', 'time'], name='appointment_doctor_slot_idx'),
+            models.Index(fields=['date', 'time'], name='appointment_date_time_idx'),
+            models.Index(fields=['approval'], name='appointment_approval_idx'),
+        ]
 
 
 class Payment(models.Model):
@@ -160,6 +265,9 @@ class Payment(models.Model):
         verbose_name = 'Payment'
         verbose_name_plural = 'Payments'
         ordering = ['amount']
+        indexes = [
+            models.Index(fields=['paid'], name='payment_paid_idx'),
+        ]
 
 
 class Review(models.Model):
@@ -168,6 +276,7 @@ class Review(models.Model):
     review = models.TextField()
     rating = models.IntegerField()
     date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.patient} {self.doctor} {self.rating}"
@@ -176,6 +285,10 @@ class Review(models.Model):
         verbose_name = 'Review'
         verbose_name_plural = 'Reviews'
         ordering = ['rating']
+        indexes = [
+            models.Index(fields=['doctor', '-id'], name='review_doctor_id_idx'),
+            models.Index(fields=['rating'], name='review_rating_idx'),
+        ]
 
 
 class Prescription(models.Model):
@@ -204,3 +317,28 @@ class MedicalRecord(models.Model):
     class Meta:
         verbose_name = 'Medical Record'
         verbose_name_plural = 'Medical Records'
+
+
+
+class OutgoingEmail(models.Model):
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.EmailField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.to} {self.subject}"
+
+    class Meta:
+        verbose_name = 'Outgoing Email'
+        verbose_name_plural = 'Outgoing Emails'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(sent_at__isnull=True),
+                         name='outgoingemail_pending_idx'),
+        ]
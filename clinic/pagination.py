@@ -1,4 +1,157 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import PageNumberPagination, CursorPagination, _reverse_ordering
 
 class DefaultPagination(PageNumberPagination):
-    page_size = 10
\ No newline at end of file
+    page_size = 10
+
+class KeysetPagination(CursorPagination):
+    """Cursor pagination whose position is the whole ordering key, ending in id.
+
+    DRF encodes only the first ordering field and skips ties with an offset;
+    here the cursor holds every field, so each page is one keyset query
+    ``(a, b, id) > (x, y, z)`` and no cursor ever carries an offset.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for filter_cls in getattr(view, 'filter_backends', []):
+            if issubclass(filter_cls, OrderingFilter):
+                ordering = filter_cls().get_ordering(request, queryset, view)
+                break
+        if not ordering and 'search_rank' in queryset.query.annotations:
+            # Keep the relevance order of a search, as page-number mode does.
+            ordering = ('-search_rank', 'id')
+        if not ordering:
+            ordering = (self.ordering,) if isinstance(self.ordering, str) else self.ordering
+        ordering = tuple(ordering)
+        # Break ties on the primary key so every ordering is a total order.
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering = (*ordering, '-id' if ordering[0].startswith('-') else 'id')
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        current_position = self.cursor.position if self.cursor is not None else None
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if current_position is not None:
+            queryset = queryset.filter(self._after(json.loads(current_position), reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = True, current_position
+            self.has_previous, self.previous_position = following_position is not None, following_position
+        else:
+            self.has_next, self.next_position = following_position is not None, following_position
+            self.has_previous = current_position is not None
+            self.previous_position = current_position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def _after(self, position, reverse):
+        # Rows past the position: equal on a prefix of the key, then beyond it on the next field.
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            condition |= equal & Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def decode_cursor(self, request):
+        # Offsets are never issued, so a cursor without a position starts over.
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def _get_position_from_instance(self, instance, ordering):
+        # Follow related lookups such as 'user__first_name' from OrderingFilter.
+        position = []
+        for field in ordering:
+            attr = instance
+            for part in field.lstrip('-').split('__'):
+                attr = attr[part] if isinstance(attr, dict) else getattr(attr, part)
+            position.append(str(attr))
+        return json.dumps(position)
+
+class KeysetPaginationMixin:
+    """Switch a view to keyset pagination when the client asks for ?pagination=cursor."""
+    keyset_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = self.keyset_pagination_class()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator for large admin changelists that avoids exact COUNT(*) scans.
+
+    On PostgreSQL an unfiltered table is counted from the planner's row
+    estimate in pg_class. A filtered queryset is counted exactly up to
+    estimate_threshold rows and estimated with EXPLAIN beyond that.
+    """
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+        if not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= self.estimate_threshold:
+                return int(row[0])
+            return super().count
+        capped = queryset.order_by()[:self.estimate_threshold].count()
+        if capped < self.estimate_threshold:
+            return capped
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return max(int(plan[0]['Plan']['Plan Rows']), capped)
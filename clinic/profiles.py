@@ -0,0 +1,39 @@
+from .models import User, Doctor, Patient
+
+
+def get_profile(request):
+    """Return the Doctor or Patient of the requesting user, or None.
+
+    The user, both roles, the doctor's location and the profile image are
+    loaded in one joined query and the result is cached on the request.
+    """
+    if not hasattr(request, '_clinic_profile'):
+        profile = None
+        if request.user.is_authenticated:
+            user = User.objects.select_related('doctor__location', 'patient', 'userimage') \
+                .get(pk=request.user.pk)
+            try:
+                profile = user.doctor
+            except Doctor.DoesNotExist:
+                try:
+                    profile = user.patient
+                except Patient.DoesNotExist:
+                    pass
+        request._clinic_profile = profile
+    return request._clinic_profile
+
+
+def get_role(request):
+    """Return 'doctor', 'patient' or None for the requesting user.
+
+    Tokens carry the role as a signed claim, so this only queries for
+    tokens issued before the claim existed.
+    """
+    if request.auth is not None and 'role' in request.auth:
+        return request.auth['role']
+    profile = get_profile(request)
+    if isinstance(profile, Doctor):
+        return 'doctor'
+    if isinstance(profile, Patient):
+        return 'patient'
+    return None
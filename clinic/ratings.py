@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models import Avg, Count
+from django.utils import timezone
+
+from .caching import invalidate_responses
+from .models import Doctor, Review
+
+
+def update_doctor_rating(doctor_id, added=None, removed=None):
+    """Fold a review's rating into, or out of, the doctor's stored average.
+
+    Must run inside the transaction that writes the review; the doctor row
+    is locked so concurrent reviews apply one after another. Every call
+    moves reviews_updated_at, the version of the doctor's review list, so
+    edits that keep the rating pass no arguments. Does nothing if the
+    doctor is gone, as when its reviews are removed by a cascade.
+    """
+    doctor = Doctor.objects.select_for_update().only('rating_avg', 'rating_count').filter(pk=doctor_id).first()
+    if doctor is None:
+        return
+    doctor.reviews_updated_at = timezone.now()
+    if added is None and removed is None:
+        doctor.save(update_fields=['reviews_updated_at'])
+        return
+    total = doctor.rating_avg * doctor.rating_count
+    count = doctor.rating_count
+    if removed is not None:
+        total -= removed
+        count -= 1
+    if added is not None:
+        total += added
+        count += 1
+    doctor.rating_count = max(count, 0)
+    doctor.rating_avg = total / count if count > 0 else 0
+    doctor.save(update_fields=['rating_avg', 'rating_count', 'updated_at', 'reviews_updated_at'])
+
+
+def recount_doctor_rating(doctor_id):
+    """Recompute one doctor's rating aggregates from its reviews."""
+    aggregates = Review.objects.filter(doctor_id=doctor_id).aggregate(avg=Avg('rating'), count=Count('id'))
+    now = timezone.now()
+    Doctor.objects.filter(pk=doctor_id).update(rating_avg=aggregates['avg'] or 0, rating_count=aggregates['count'],
+                                               updated_at=now, reviews_updated_at=now)
+
+
+def rebuild_doctor_ratings(batch_size=1000):
+    """Recompute every doctor's rating aggregates from the reviews table.
+
+    Both the doctor and review list versions move, and cached responses are
+    dropped once the rebuild commits, since the bulk writes send no signals.
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        Doctor.objects.update(rating_avg=0, rating_count=0, updated_at=now, reviews_updated_at=now)
+        aggregates = Review.objects.order_by().values('doctor_id') \
+            .annotate(avg=Avg('rating'), count=Count('id'))
+        doctors = [Doctor(id=row['doctor_id'], rating_avg=row['avg'], rating_count=row['count'], updated_at=now)
+                   for row in aggregates]
+        Doctor.objects.bulk_update(doctors, ['rating_avg', 'rating_count', 'updated_at'], batch_size=batch_size)
+        transaction.on_commit(invalidate_responses)
+    return len(doctors)
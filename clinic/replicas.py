@@ -0,0 +1,120 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'replica_pin'
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def reading_from_replica():
+    return _use_replica.get() and bool(settings.DATABASE_REPLICAS)
+
+
+def _pinned(request):
+    # The signature's timestamp bounds the pin, however long the client keeps the cookie.
+    if request.get_signed_cookie(PIN_COOKIE, default=None, salt=PIN_COOKIE,
+                                 max_age=settings.REPLICA_LAG_SECONDS):
+        return True
+    key = _client_key(request)
+    return key is not None and bool(cache.get(key))
+
+
+def _client_key(request):
+    # The JWT identifies a signed-in client. Anonymous clients are pinned by
+    # the cookie alone: behind a proxy many of them share one address.
+    credentials = request.META.get('HTTP_AUTHORIZATION')
+    if not credentials:
+        return None
+    return 'replica-pin:' + hashlib.md5(credentials.encode()).hexdigest()
+
+
+class ReplicaRouter:
+    """Send reads to a replica while ReplicaMiddleware allows it.
+
+    Writes, and reads inside a transaction on the primary, such as booking
+    an appointment under select_for_update, always use the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading_from_replica() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Route safe requests for a viewset's replica_actions to the replicas.
+
+    A client that sent a write is pinned to the primary for
+    REPLICA_LAG_SECONDS so it reads its own changes. The pin is a signed
+    cookie on the write's response, so whichever worker serves the next read
+    sees it; clients that drop cookies fall back to a pin in the cache, which
+    only reaches every worker when the cache is shared. Like MetricsMiddleware
+    it runs natively under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        key = self.pin(request, response)
+        if key is not None:
+            cache.set(key, True, settings.REPLICA_LAG_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        token = _use_replica.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        key = self.pin(request, response)
+        if key is not None:
+            await cache.aset(key, True, settings.REPLICA_LAG_SECONDS)
+        return response
+
+    def pin(self, request, response):
+        """Set the pin cookie after a write and return the cache key to pin, if any."""
+        if request.method in SAFE_METHODS or not settings.DATABASE_REPLICAS:
+            return None
+        response.set_signed_cookie(PIN_COOKIE, '1', salt=PIN_COOKIE, max_age=settings.REPLICA_LAG_SECONDS,
+                                   secure=request.is_secure(), httponly=True, samesite='Lax')
+        return _client_key(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in SAFE_METHODS or not settings.DATABASE_REPLICAS:
+            return None
+        # DRF's ViewSet.as_view() exposes the viewset and its method-to-action map.
+        actions = getattr(view_func, 'actions', None) or {}
+        replica_actions = getattr(getattr(view_func, 'cls', None), 'replica_actions', ())
+        if actions.get(request.method.lower()) in replica_actions and not _pinned(request):
+            _use_replica.set(True)
+        return None
@@ -0,0 +1,93 @@
+import re
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, When
+from rest_framework.filters import SearchFilter
+
+from .models import Doctor, DoctorSearchTerm
+
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 5
+EXACT_MATCH_BONUS = 2
+
+# Weight of a matching term, per source field.
+FIELD_WEIGHTS = (
+    ('user.first_name', 3),
+    ('user.last_name', 3),
+    ('specialization', 2),
+    ('location.city', 1),
+    ('location.state', 1),
+    ('location.address', 1),
+)
+
+
+def tokenize(text):
+    return [token[:MAX_TERM_LENGTH] for token in re.findall(r'\w+', text.lower())]
+
+
+def _field_value(doctor, path):
+    value = doctor
+    for attr in path.split('.'):
+        value = getattr(value, attr)
+    return value or ''
+
+
+def build_search_terms(doctor):
+    weights = {}
+    for path, weight in FIELD_WEIGHTS:
+        for token in tokenize(_field_value(doctor, path)):
+            weights[token] = max(weights.get(token, 0), weight)
+    return [DoctorSearchTerm(doctor=doctor, term=term, weight=weight) for term, weight in weights.items()]
+
+
+def index_doctor(doctor):
+    with transaction.atomic():
+        DoctorSearchTerm.objects.filter(doctor=doctor).delete()
+        DoctorSearchTerm.objects.bulk_create(build_search_terms(doctor))
+
+
+def rebuild_search_index(batch_size=1000):
+    """Rebuild the search terms of every doctor, one batch of doctors at a time."""
+    indexed = 0
+    with transaction.atomic():
+        DoctorSearchTerm.objects.all().delete()
+        terms = []
+        doctors = Doctor.objects.select_related('user', 'location').order_by('pk')
+        for doctor in doctors.iterator(chunk_size=batch_size):
+            terms.extend(build_search_terms(doctor))
+            indexed += 1
+            if len(terms) >= batch_size:
+                DoctorSearchTerm.objects.bulk_create(terms)
+                terms = []
+        DoctorSearchTerm.objects.bulk_create(terms)
+    return indexed
+
+
+def search_doctors(queryset, text):
+    """Filter to doctors matching every query term by prefix, ranked by weight.
+
+    Each term narrows the queryset through the indexed term column, so the
+    scan starts from matching terms rather than from every doctor.
+    """
+    terms = tokenize(text)[:MAX_QUERY_TERMS]
+    if not terms:
+        return queryset
+    for term in terms:
+        queryset = queryset.filter(
+            pk__in=DoctorSearchTerm.objects.filter(term__startswith=term).values('doctor_id'))
+    rank = DoctorSearchTerm.objects \
+        .filter(reduce(or_, (Q(term__startswith=term) for term in terms)), doctor=OuterRef('pk')) \
+        .order_by().values('doctor') \
+        .annotate(rank=Sum(Case(When(term__in=terms, then=F('weight') * EXACT_MATCH_BONUS),
+                                default=F('weight'), output_field=IntegerField()))) \
+        .values('rank')
+    return queryset.annotate(search_rank=Subquery(rank)).order_by('-search_rank', 'pk')
+
+
+class DoctorSearchFilter(SearchFilter):
+    """SearchFilter backed by the DoctorSearchTerm index instead of ICONTAINS scans."""
+
+    def filter_queryset(self, request, queryset, view):
+        return search_doctors(queryset, request.query_params.get(self.search_param, ''))
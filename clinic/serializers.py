@@ -1,17 +1,36 @@
-from django.core.mail import send_mail
+from django.core.files.storage import default_storage
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import transaction
+from django.shortcuts import get_object_or_404
 from rest_framework import serializers
-import jwt
 from drf_writable_nested import WritableNestedModelSerializer
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer
 from djoser.serializers import UserSerializer as BaseUserSerializer
-from .models import Doctor, Patient, Location, Review, Appointment, UserImage, User, DoctorDegree
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
+from .authentication import token_version, user_role
+from .models import Doctor, Patient, Location, Review, Appointment, UserImage, User, DoctorDegree, DegreeUpload
+from .images import schedule_image_processing, pick_variant, THUMBNAIL_FORMATS, DEFAULT_THUMBNAIL_FORMAT
+from .mail import queue_verification_mail
+from .metrics import TimedDataMixin, TimedListSerializer
+from .uploads import discard_degree, inspect_pdf, store_degree
 from datetime import date
-import environ
 
-env = environ.Env()
-environ.Env.read_env('.env')
+def get_image_url(user, request, width=None):
+    # Reads the reverse one-to-one cache, so querysets that select_related
+    # 'user__userimage' resolve images without a query per row.
+    try:
+        user_image = user.userimage
+    except UserImage.DoesNotExist:
+        return None
+    if not user_image.image:
+        return None
+    if width is None:
+        return request.build_absolute_uri(user_image.image.url)
+    image_format = request.GET.get('image_format', DEFAULT_THUMBNAIL_FORMAT)
+    if image_format not in THUMBNAIL_FORMATS:
+        image_format = DEFAULT_THUMBNAIL_FORMAT
+    name = pick_variant(user_image, width, image_format)
+    return request.build_absolute_uri(default_storage.url(name))
 
 class LocationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -32,17 +51,7 @@ class UserCreateSerializer(BaseUserCreateSerializer):
 
     def create(self, validated_data):
         user = User.objects.create_user(**validated_data)
-        base_url = env('BASE_CLIENT_URL')
-        token = jwt.encode({
-            'user_id': user.id,
-            'created_at': str(date.today()),
-            'is_active': user.is_active,
-        }, key='secret')
-        send_mail(
-            'Email Verification',
-            f'Please verify your email by clicking on the link below:\n{base_url}/?token={token}', '',
-            [user.email]
-        )
+        queue_verification_mail(user)
         return user
 
 class UserImageSerializer(serializers.ModelSerializer):
@@ -53,7 +62,17 @@ class UserImageSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user_id = self.context['user_id']
         user = User.objects.get(id=user_id)
-        return UserImage.objects.create(user=user, **validated_data)
+        user_image = UserImage.objects.create(user=user, **validated_data)
+        schedule_image_processing(user_image)
+        return user_image
+
+    def update(self, instance, validated_data):
+        if 'image' in validated_data:
+            validated_data = {**validated_data, 'thumbnails': {}}
+        user_image = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_image_processing(user_image)
+        return user_image
 
 class UserSerializer(BaseUserSerializer):
     class Meta(BaseUserSerializer.Meta):
@@ -62,13 +81,29 @@ class UserSerializer(BaseUserSerializer):
 class DoctorDegreeSerializer(serializers.ModelSerializer):
     class Meta:
         model = DoctorDegree
-        fields = ['id', 'degree']
+        fields = ['id', 'degree', 'upload']
+    upload = serializers.PrimaryKeyRelatedField(queryset=DegreeUpload.objects.filter(completed=True),
+                                                required=False, write_only=True)
+
+    def validate_degree(self, value):
+        if value is not None:
+            value.sha256, is_pdf = inspect_pdf(value)
+            if not is_pdf:
+                raise serializers.ValidationError('File is not a PDF document.')
+        return value
 
-class DoctorSerializer(WritableNestedModelSerializer, serializers.ModelSerializer):
+class DegreeUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DegreeUpload
+        fields = ['id', 'size', 'offset', 'completed']
+        read_only_fields = ['offset', 'completed']
+
+class DoctorSerializer(TimedDataMixin, WritableNestedModelSerializer, serializers.ModelSerializer):
     class Meta:
         model = Doctor
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'first_name', 'last_name', 'email', 'phone_number', 'gender', 'password', 
-                  'specialization', 'charges', 'image_url', 'location', 'degree']
+                  'specialization', 'charges', 'rating_avg', 'rating_count', 'image_url', 'location', 'degree']
     location = LocationSerializer()
     image_url = serializers.SerializerMethodField(read_only=True, method_name='get_image')
     id = serializers.IntegerField(read_only=True)
@@ -82,26 +117,42 @@ class DoctorSerializer(WritableNestedModelSerializer, serializers.ModelSerialize
     charges = serializers.DecimalField(max_digits=8, decimal_places=2,
                                         validators=[MinValueValidator(1)])
     
+    rating_avg = serializers.FloatField(read_only=True)
+    rating_count = serializers.IntegerField(read_only=True)
     degree = DoctorDegreeSerializer(write_only=True)
     
     def get_image(self, obj):
-        if UserImage.objects.filter(user_id=obj.user.id).exists():
-            request = self.context.get('request')
-            return request.build_absolute_uri(UserImage.objects.get(user_id=obj.user.id).image.url)
-        return None
+        return get_image_url(obj.user, self.context.get('request'), self.context.get('image_width'))
 
     def create(self, validated_data):
-        with transaction.atomic():
-            user_data = validated_data.pop('user')
-            user = UserCreateSerializer(data=user_data, context=self.context)
-            user.is_valid(raise_exception=True)
-            user.save()
-            location = validated_data.pop('location')
-            location = Location.objects.create(**location)
-            degree = validated_data.pop('degree')
-            doctor = Doctor.objects.create(user=user.instance, location=location, **validated_data)
-            DoctorDegree.objects.create(doctor=doctor, **degree)
-            return doctor
+        # The degree is written to storage before the transaction opens, so
+        # the database is never held while the file is copied. If the
+        # transaction fails, the file is removed unless something else uses it.
+        degree = validated_data.pop('degree')
+        upload = degree.pop('upload', None)
+        stored = None
+        if upload is not None:
+            degree = {'degree': upload.degree.name, 'sha256': upload.sha256}
+        elif degree.get('degree'):
+            degree['sha256'] = degree['degree'].sha256
+            degree['degree'] = stored = store_degree(degree['degree'], degree['sha256'])
+        try:
+            with transaction.atomic():
+                user_data = validated_data.pop('user')
+                user = UserCreateSerializer(data=user_data, context=self.context)
+                user.is_valid(raise_exception=True)
+                user.save()
+                location = validated_data.pop('location')
+                location = Location.objects.create(**location)
+                doctor = Doctor.objects.create(user=user.instance, location=location, **validated_data)
+                DoctorDegree.objects.create(doctor=doctor, **degree)
+                if upload is not None:
+                    upload.delete()
+                return doctor
+        except Exception:
+            if stored is not None:
+                discard_degree(stored)
+            raise
 
     # first_name = serializers.CharField(max_length=255)
     # last_name = serializers.CharField(max_length=255)
@@ -136,7 +187,7 @@ class DoctorUpdateSerializer(serializers.ModelSerializer):
             user.save()
             return super().update(instance, validated_data)
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(TimedDataMixin, serializers.ModelSerializer):
     class Meta:
         model = Patient
         fields = ['id', 'first_name', 'last_name', 'gender', 'email', 'phone_number', 'password', 'birth_date', 'age', 'image']
@@ -164,10 +215,7 @@ class PatientSerializer(serializers.ModelSerializer):
         return f'{age} days'
 
     def get_image(self, obj):
-        if UserImage.objects.filter(user_id=obj.user.id).exists():
-            request = self.context.get('request')
-            return request.build_absolute_uri(UserImage.objects.get(user_id=obj.user.id).image.url)
-        return None
+        return get_image_url(obj.user, self.context.get('request'), self.context.get('image_width'))
 
     def create(self, validated_data):
         with transaction.atomic():
@@ -201,9 +249,10 @@ class PatientUpdateSerializer(serializers.ModelSerializer):
             user.save()
             return super().update(instance, validated_data)
         
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedDataMixin, serializers.ModelSerializer):
     class Meta:
         model = Review
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'patient', 'patient_name', 'rating', 'review', 'date']
     id = serializers.IntegerField(read_only=True)
     patient = serializers.PrimaryKeyRelatedField(queryset=Patient.objects.select_related().all())
@@ -216,14 +265,31 @@ class ReviewSerializer(serializers.ModelSerializer):
         return f'{obj.patient.user.first_name} {obj.patient.user.last_name}'
 
     def create(self, validated_data):
-        doctor_id = self.context['view'].kwargs['doctors_pk']
-        doctor = Doctor.objects.get(id=doctor_id)
-        return Review.objects.create(doctor=doctor, **validated_data)
+        doctor_id = self.context['view'].get_doctor_id()
+        # The review signals fold the rating into the doctor's aggregates in
+        # the same transaction.
+        with transaction.atomic():
+            doctor = get_object_or_404(Doctor, id=doctor_id)
+            return Review.objects.create(doctor=doctor, **validated_data)
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            return super().update(instance, validated_data)
     
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(TimedDataMixin, serializers.ModelSerializer):
     class Meta:
         model = Appointment
         fields = ['id', 'doctor', 'patient', 'date', 'time']
     
 class TokenSerializer(serializers.Serializer):
-    token = serializers.CharField(max_length=255)
\ No newline at end of file
+    token = serializers.CharField(max_length=255)
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        # Refreshed access tokens copy these claims from the refresh token.
+        token = super().get_token(user)
+        token['role'] = user_role(user)
+        token['is_active'] = user.is_active
+        token['ver'] = token_version(user)
+        return token
@@ -0,0 +1,203 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .authentication import evict_user
+from .availability import invalidate_day, invalidate_doctor
+from .caching import invalidate_responses
+from .images import delete_stored, stored_names
+from .ratings import update_doctor_rating, recount_doctor_rating
+from .search import index_doctor
+from .models import Appointment, WorkingHours, Doctor, Patient, User, Location, UserImage, Review
+
+
+def _slot_day(instance):
+    # Read from __dict__ so deferred fields are not loaded.
+    return instance.__dict__.get('doctor_id'), instance.__dict__.get('date')
+
+
+def _invalidate_days(days):
+    for doctor_id, day in days:
+        invalidate_day(doctor_id, day)
+
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_day(sender, instance, **kwargs):
+    instance._saved_day = _slot_day(instance)
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, **kwargs):
+    previous, instance._saved_day = instance._saved_day, _slot_day(instance)
+    days = {(instance.doctor_id, instance.date)}
+    if not created:
+        if None in previous:
+            # Loaded without its doctor or date, so the day it left is unknown.
+            transaction.on_commit(partial(invalidate_doctor, instance.doctor_id))
+        else:
+            days.add(previous)
+    # Wait for the commit so a concurrent miss cannot cache the slot as free.
+    transaction.on_commit(partial(_invalidate_days, days))
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_day, instance.doctor_id, instance.date))
+
+
+def _rated(instance):
+    return instance.__dict__.get('doctor_id'), instance.__dict__.get('rating')
+
+
+@receiver(post_init, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    instance._saved_rating = _rated(instance)
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, raw, **kwargs):
+    (doctor_id, rating), instance._saved_rating = instance._saved_rating, _rated(instance)
+    if raw:
+        return
+    with transaction.atomic():
+        if created:
+            update_doctor_rating(instance.doctor_id, added=instance.rating)
+        elif doctor_id is None or rating is None:
+            # Loaded without its doctor or rating, so the old value is unknown.
+            recount_doctor_rating(instance.doctor_id)
+        elif doctor_id != instance.doctor_id:
+            update_doctor_rating(doctor_id, removed=rating)
+            update_doctor_rating(instance.doctor_id, added=instance.rating)
+        elif rating != instance.rating:
+            update_doctor_rating(instance.doctor_id, added=instance.rating, removed=rating)
+        else:
+            update_doctor_rating(instance.doctor_id)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    # Also runs for reviews removed by a cascade from their patient or user.
+    with transaction.atomic():
+        update_doctor_rating(instance.doctor_id, removed=instance.rating)
+
+
+@receiver(post_save, sender=WorkingHours)
+@receiver(post_delete, sender=WorkingHours)
+def working_hours_changed(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_doctor, instance.doctor_id))
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(post_save, sender=UserImage)
+@receiver(post_delete, sender=UserImage)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def doctor_data_changed(sender, instance, **kwargs):
+    # Wait for the commit so a concurrent miss cannot cache the old rows again.
+    transaction.on_commit(invalidate_responses)
+
+
+# User fields that appear in cached doctor responses. Deleting a doctor's
+# user deletes the doctor, which invalidates through the Doctor receiver.
+CACHED_USER_FIELDS = ('first_name', 'last_name', 'email', 'phone_number', 'gender')
+
+
+def _cached_user_data(instance):
+    return tuple(instance.__dict__.get(field) for field in CACHED_USER_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_cached_user_data(sender, instance, **kwargs):
+    instance._saved_cached_data = _cached_user_data(instance)
+
+
+@receiver(post_save, sender=User)
+def doctor_user_changed(sender, instance, created, **kwargs):
+    previous, instance._saved_cached_data = instance._saved_cached_data, _cached_user_data(instance)
+    # Logins, password changes and new accounts leave cached doctors as they are.
+    if not created and previous != instance._saved_cached_data \
+            and Doctor.objects.filter(user=instance).exists():
+        transaction.on_commit(invalidate_responses)
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or not fields.isdisjoint(update_fields)
+
+
+@receiver(post_save, sender=Doctor)
+def index_saved_doctor(sender, instance, update_fields, **kwargs):
+    if _touches(update_fields, {'specialization', 'user', 'location'}):
+        index_doctor(instance)
+
+
+@receiver(post_save, sender=User)
+def index_doctor_user(sender, instance, update_fields, **kwargs):
+    if _touches(update_fields, {'first_name', 'last_name'}):
+        for doctor in Doctor.objects.select_related('user', 'location').filter(user=instance):
+            index_doctor(doctor)
+
+
+@receiver(post_save, sender=Location)
+def index_doctor_location(sender, instance, update_fields, **kwargs):
+    if _touches(update_fields, {'address', 'city', 'state'}):
+        for doctor in Doctor.objects.select_related('user', 'location').filter(location=instance):
+            index_doctor(doctor)
+
+
+@receiver(post_save, sender=User)
+def touch_user_profiles(sender, instance, update_fields, **kwargs):
+    # Logins and password changes do not show up in the profile payloads.
+    if _touches(update_fields, {field.name for field in User._meta.concrete_fields} - {'last_login', 'password'}):
+        now = timezone.now()
+        Doctor.objects.filter(user=instance).update(updated_at=now)
+        Patient.objects.filter(user=instance).update(updated_at=now)
+        # Review lists show the patient's name.
+        Doctor.objects.filter(review__patient__user=instance).update(reviews_updated_at=now)
+
+
+@receiver(post_save, sender=UserImage)
+@receiver(post_delete, sender=UserImage)
+def touch_image_profiles(sender, instance, **kwargs):
+    now = timezone.now()
+    Doctor.objects.filter(user_id=instance.user_id).update(updated_at=now)
+    Patient.objects.filter(user_id=instance.user_id).update(updated_at=now)
+
+
+def _image_files(instance):
+    image = instance.__dict__.get('image')
+    return stored_names(getattr(image, 'name', image), instance.__dict__.get('thumbnails') or {})
+
+
+@receiver(post_init, sender=UserImage)
+def remember_image_files(sender, instance, **kwargs):
+    instance._saved_files = _image_files(instance)
+
+
+@receiver(post_save, sender=UserImage)
+def delete_replaced_image_files(sender, instance, **kwargs):
+    previous, instance._saved_files = instance._saved_files, _image_files(instance)
+    replaced = previous - instance._saved_files
+    if replaced:
+        transaction.on_commit(partial(delete_stored, replaced))
+
+
+@receiver(post_delete, sender=UserImage)
+def delete_image_files(sender, instance, **kwargs):
+    transaction.on_commit(partial(delete_stored, _image_files(instance)))
+
+
+@receiver(post_save, sender=Location)
+def touch_location_doctor(sender, instance, **kwargs):
+    Doctor.objects.filter(location=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    evict_user(instance.pk)
@@ -1,3 +1,1572 @@
-from django.test import TestCase
+import asyncio
+import csv
+from base64 import b64decode, b64encode
+import hashlib
+import json
+import importlib
+import os
+import runpy
+import tempfile
+import time as time_module
+import threading
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from smtplib import SMTPException
+from types import SimpleNamespace
+from unittest import mock, skipIf, skipUnless
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.hashers import check_password, make_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import StopUpload
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+from rest_framework.throttling import ScopedRateThrottle
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from . import authentication
+from .authentication import CachedJWTAuthentication, token_version
+from .availability import get_free_slots, invalidate_doctor
+from .caching import VERSION_KEY, get_cache_stats, get_response_cache
+from .exports import export_rows, render_csv
+from .images import pick_variant, process_user_image
+from .imports import hash_passwords, init_hash_worker
+from .filtering import DoctorFilter, get_facets
+from .mail import send_queued_mail, MAX_ATTEMPTS
+from .replicas import PIN_COOKIE, ReplicaMiddleware
+from .serializers import TokenObtainPairSerializer
+from .models import Doctor, User, Location, UserImage, Patient, Appointment, Payment, Review, WorkingHours, \
+    OutgoingEmail, DoctorSearchTerm, DegreeUpload, DoctorDegree, Prescription, MedicalRecord
+from . import uploads
+from .pagination import EstimatedCountPaginator
+from .profiles import get_profile, get_role
+from .ratings import rebuild_doctor_ratings
+from .uploads import PDFUploadHandler, partial_path, write_chunk
+from .urls import router, doctors_router
+
+
+def create_user(prefix, index, **kwargs):
+    # No password hashing; API tests authenticate with force_authenticate.
+    return User.objects.create(email=f'{prefix}{index}@example.com', phone_number=f'{prefix}-{index}',
+                               first_name=f'{prefix.title()}{index:05}', last_name='Test', gender='Female',
+                               is_active=True, **kwargs)
+
+
+def create_doctor(index, image=True, **kwargs):
+    user = create_user('doctor', index)
+    if image:
+        UserImage.objects.create(user=user, image=f'users/images/doctor{index}.jpg')
+    location = Location.objects.create(lat=40 + index / 1000, lng=-74, address=f'{index} Main Street',
+                                       city='Springfield', state='Illinois')
+    kwargs = {'specialization': 'Cardiology', 'charges': 100, 'approval_status': 'approved', **kwargs}
+    return Doctor.objects.create(user=user, location=location, **kwargs)
+
+
+def create_patient(index, image=True):
+    user = create_user('patient', index)
+    if image:
+        UserImage.objects.create(user=user, image=f'users/images/patient{index}.jpg')
+    return Patient.objects.create(user=user, birth_date=date(1990, 1, 1))
+
+
+class QueryPlanMixin:
+    def assertUsesIndex(self, queryset, *index_names):
+        if connection.vendor == 'postgresql':
+            # Tables in a test run are tiny, so rule out the sequential scan.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), f'{index_names} not used:\n{plan}')
+
+
+class IndexUsageTests(QueryPlanMixin, TestCase):
+    """Guard the hot filter and ordering paths against losing their indexes."""
+
+    def test_doctor_filters(self):
+        self.assertUsesIndex(Doctor.objects.filter(charges__gte=100, charges__lte=200), 'doctor_charges_idx')
+        self.assertUsesIndex(Doctor.objects.filter(approval_status='approved'), 'doctor_approval_status_idx')
+
+    @skipUnless(connection.vendor == 'postgresql', 'iexact and istartswith compare UPPER() on PostgreSQL only')
+    def test_case_insensitive_lookups(self):
+        self.assertUsesIndex(Doctor.objects.filter(specialization__iexact='cardiology'), 'doctor_spec_upper_idx')
+        self.assertUsesIndex(Doctor.objects.filter(specialization__istartswith='card'), 'doctor_spec_upper_idx')
+        self.assertUsesIndex(User.objects.filter(first_name__istartswith='ann'), 'user_first_name_upper_idx')
+        self.assertUsesIndex(User.objects.filter(last_name__istartswith='lee'), 'user_last_name_upper_idx')
+
+    def test_user_name_ordering(self):
+        self.assertUsesIndex(User.objects.order_by('first_name', 'last_name'), 'user_name_idx')
+
+    def test_appointment_slot_lookups(self):
+        slot = {'date': date(2024, 1, 1), 'time': time(9)}
+        self.assertUsesIndex(Appointment.objects.filter(doctor_id=1, **slot), 'appointment_doctor_slot_idx')
+        self.assertUsesIndex(Appointment.objects.filter(patient_id=1, doctor_id=1, date=slot['date']),
+                             # SQLite names the index of an inline UNIQUE itself.
+                             'unique_appointment', 'sqlite_autoindex_clinic_appointment')
+        self.assertUsesIndex(Appointment.objects.filter(approval='pending'), 'appointment_approval_idx')
+        self.assertUsesIndex(Appointment.objects.order_by('date', 'time'), 'appointment_date_time_idx')
+
+    def test_admin_filters(self):
+        self.assertUsesIndex(Payment.objects.filter(paid='unpaid'), 'payment_paid_idx')
+        self.assertUsesIndex(Review.objects.filter(rating=5), 'review_rating_idx')
+
+
+class DoctorListQueryTests(APITestCase):
+    """Profile images come from the joined userimage row, never a query per doctor."""
+
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/doctors/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(row['image_url'] for row in response.data['results']))
+        return len(response.data['results']), len(queries)
+
+    def test_query_count_is_constant_across_page_sizes(self):
+        counts = {}
+        created = 0
+        for page_size in (10, 50, 100):
+            while created < page_size:
+                create_doctor(created)
+                created += 1
+            rows, counts[page_size] = self.count_queries({'pagination': 'cursor', 'page_size': page_size})
+            self.assertEqual(rows, page_size)
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_page_number_query_count(self):
+        for index in range(10):
+            create_doctor(index)
+        _, first = self.count_queries({})
+        cache.clear()
+        for index in range(10, 30):
+            create_doctor(index)
+        _, second = self.count_queries({'page': 2})
+        self.assertEqual(first, second)
+
+
+class QueryGrowthTests(APITestCase):
+    """Every GET route and admin changelist runs as many queries at N rows as at 2N.
+
+    A route added without an entry in detail_kwargs fails here, so it cannot
+    skip the check.
+    """
+    N = 4
+    # Serializes the User row with the profile serializers and fails for any pk.
+    broken_routes = {'users-detail'}
+
+    def setUp(self):
+        self.seeded = 0
+        self.seed(self.N)
+        self.first_doctor = Doctor.objects.earliest('pk')
+        self.first_patient = Patient.objects.earliest('pk')
+        self.user = self.first_patient.user
+        self.admin = create_user('admin', 0, is_staff=True, is_superuser=True)
+
+    def seed(self, count):
+        for index in range(self.seeded, self.seeded + count):
+            doctor = create_doctor(index)
+            patient = create_patient(index)
+            first_doctor = Doctor.objects.earliest('pk')
+            WorkingHours.objects.create(doctor=doctor, weekday=index % 7, start_time=time(9), end_time=time(17))
+            Review.objects.create(doctor=first_doctor, patient=patient, review='Fine', rating=index % 5 + 1)
+            appointment = Appointment.objects.create(doctor=first_doctor, patient=patient,
+                                                     date=date.today() + timedelta(days=1), time=time(9 + index))
+            Payment.objects.create(appointment=appointment, amount=100, payment_method='card')
+            prescription = Prescription.objects.create(doctor=first_doctor, patient=patient, date=date.today(),
+                                                       prescription='Rest')
+            MedicalRecord.objects.create(prescription=prescription, symptoms='Cough', diagnosis='Cold')
+            DegreeUpload.objects.create(size=100)
+        self.seeded += count
+
+    def detail_kwargs(self, name):
+        return {
+            'users-images-detail': {'pk': self.user.userimage.pk},
+            'doctors-degrees-uploads-detail': {'pk': DegreeUpload.objects.earliest('created_at').pk},
+            'doctors-detail': {'pk': self.first_doctor.pk},
+            'doctors-availability': {'pk': self.first_doctor.pk},
+            'doctors-reviews-list': {'doctors_pk': self.first_doctor.pk},
+            'doctors-reviews-detail': {'doctors_pk': self.first_doctor.pk,
+                                       'pk': Review.objects.earliest('pk').pk},
+            'patients-detail': {'pk': self.first_patient.pk},
+        }.get(name)
+
+    def api_urls(self):
+        for pattern in router.urls + doctors_router.urls:
+            if 'get' not in getattr(pattern.callback, 'actions', {}) or pattern.name in self.broken_routes:
+                continue
+            kwargs = {}
+            if pattern.pattern.regex.groups:
+                kwargs = self.detail_kwargs(pattern.name)
+                self.assertIsNotNone(kwargs, f'No objects to request {pattern.name} with.')
+            yield pattern.name, reverse(pattern.name, kwargs=kwargs)
+
+    def admin_urls(self):
+        for model in admin.site._registry:
+            if model._meta.app_label == 'clinic':
+                name = f'admin:clinic_{model._meta.model_name}_changelist'
+                yield name, reverse(name)
+
+    def count_queries(self):
+        counts = {}
+        self.client.force_authenticate(self.user)
+        for name, url in self.api_urls():
+            counts[name] = self.get(url)
+        self.client.force_authenticate(None)
+        self.client.force_login(self.admin)
+        for name, url in self.admin_urls():
+            counts[name] = self.get(url)
+        self.client.logout()
+        return counts
+
+    def get(self, url):
+        # A cached response would hide the queries behind it.
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        small = self.count_queries()
+        self.seed(self.N)
+        large = self.count_queries()
+        self.assertIn('doctors-list', small)
+        self.assertIn('admin:clinic_doctor_changelist', small)
+        for name, count in small.items():
+            with self.subTest(name):
+                self.assertEqual(large[name], count)
+
+
+class NearFilterTests(QueryPlanMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def place(self, index, km_north):
+        doctor = create_doctor(index, image=False)
+        Location.objects.filter(pk=doctor.location_id).update(lat=40 + km_north / 111.045, lng=-74)
+        return doctor
+
+    def test_returns_doctors_within_radius_nearest_first(self):
+        far = self.place(0, 15)
+        middle = self.place(1, 8)
+        near = self.place(2, 0.5)
+        response = self.client.get('/doctors/', {'near': '40,-74', 'radius_km': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['results']], [near.pk, middle.pk])
+        self.assertNotIn(far.pk, [row['id'] for row in response.data['results']])
+
+    def test_rejects_bad_coordinates(self):
+        self.assertEqual(self.client.get('/doctors/', {'near': 'north'}).status_code, 400)
+        self.assertEqual(self.client.get('/doctors/', {'near': '95,0'}).status_code, 400)
+        self.assertEqual(self.client.get('/doctors/', {'near': '40,-74', 'radius_km': 0}).status_code, 400)
+
+    def test_bounding_box_uses_the_location_index(self):
+        queryset = DoctorFilter({'near': '40,-74', 'radius_km': '10'}, queryset=Doctor.objects.all()).qs
+        self.assertUsesIndex(queryset, 'location_lat_lng_idx')
+
+
+class FacetTests(APITestCase):
+    facets = 'specialization,city,charges_band'
+
+    def setUp(self):
+        cache.clear()
+        self.doctors = [
+            create_doctor(0, image=False),
+            create_doctor(1, image=False, charges=3000),
+            create_doctor(2, image=False, specialization='Dermatology'),
+        ]
+        Location.objects.filter(pk=self.doctors[1].location_id).update(city='Shelbyville', lat=41)
+
+    def get_facets(self, **params):
+        response = self.client.get('/doctors/', {'facets': self.facets, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data['facets']
+
+    def test_counts_every_doctor(self):
+        self.assertEqual(self.get_facets(), {
+            'specialization': [{'value': 'Cardiology', 'count': 2}, {'value': 'Dermatology', 'count': 1}],
+            'city': [{'value': 'Springfield', 'count': 2}, {'value': 'Shelbyville', 'count': 1}],
+            'charges_band': [{'value': '<1000', 'count': 2}, {'value': '2500-5000', 'count': 1}],
+        })
+
+    def test_counts_follow_search(self):
+        self.assertEqual(self.get_facets(search='cardio'), {
+            'specialization': [{'value': 'Cardiology', 'count': 2}],
+            'city': [{'value': 'Shelbyville', 'count': 1}, {'value': 'Springfield', 'count': 1}],
+            'charges_band': [{'value': '2500-5000', 'count': 1}, {'value': '<1000', 'count': 1}],
+        })
+
+    def test_counts_follow_radius(self):
+        # Doctor 1 sits about 110 km north of the others.
+        self.assertEqual(self.get_facets(near='40,-74', radius_km=10), {
+            'specialization': [{'value': 'Cardiology', 'count': 1}, {'value': 'Dermatology', 'count': 1}],
+            'city': [{'value': 'Springfield', 'count': 2}],
+            'charges_band': [{'value': '<1000', 'count': 2}],
+        })
+
+    def test_rejects_unknown_facets(self):
+        response = self.client.get('/doctors/', {'facets': 'specialization,colour'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('colour', str(response.data['facets']))
+
+    def test_cache_key_follows_the_filters(self):
+        with mock.patch('clinic.views.get_facets', wraps=get_facets) as counted:
+            self.get_facets(specialization__iexact='cardiology')
+            # Paging and ordering do not change the counts.
+            self.get_facets(specialization__iexact='cardiology', ordering='charges')
+            self.assertEqual(counted.call_count, 1)
+            facets = self.get_facets(specialization__iexact='dermatology')
+            self.assertEqual(counted.call_count, 2)
+        self.assertEqual(facets['specialization'], [{'value': 'Dermatology', 'count': 1}])
+
+
+class ProfileTests(APITestCase):
+    def setUp(self):
+        self.doctor = create_doctor(0)
+        self.patient = create_patient(0)
+
+    def request(self, user, auth=None):
+        return SimpleNamespace(user=User.objects.get(pk=user.pk), auth=auth)
+
+    def test_profile_is_one_joined_query(self):
+        for profile in (self.doctor, self.patient):
+            request = self.request(profile.user)
+            with self.assertNumQueries(1):
+                loaded = get_profile(request)
+                self.assertEqual(loaded, profile)
+                self.assertEqual(loaded.user.userimage.image.name, profile.user.userimage.image.name)
+                if isinstance(loaded, Doctor):
+                    self.assertEqual(loaded.location.city, 'Springfield')
+                self.assertIs(get_profile(request), loaded)
+
+    def test_role_claim_is_trusted(self):
+        token = TokenObtainPairSerializer.get_token(self.patient.user)
+        self.assertEqual(token['role'], 'patient')
+        claimed = self.request(self.patient.user, auth=token)
+        forged = self.request(self.patient.user, auth={'role': 'doctor'})
+        unclaimed = self.request(self.doctor.user, auth={})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_role(claimed), 'patient')
+            # The claim is signed, so it is not checked against the profile.
+            self.assertEqual(get_role(forged), 'doctor')
+        # Tokens issued before the claim existed fall back to the profile.
+        with self.assertNumQueries(1):
+            self.assertEqual(get_role(unclaimed), 'doctor')
+
+    def test_me_without_profile_is_404(self):
+        self.client.force_authenticate(create_user('admin', 0, is_staff=True))
+        self.assertEqual(self.client.get('/auth/users/me/').status_code, 404)
+        self.assertEqual(self.client.put('/auth/users/me/', {}).status_code, 404)
+
+    def test_me_returns_the_profile(self):
+        self.client.force_authenticate(self.patient.user)
+        response = self.client.get('/auth/users/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.patient.pk)
+
+
+class ReviewListTests(APITestCase):
+    def setUp(self):
+        self.doctor = create_doctor(0)
+        self.patient = create_patient(0)
+        Review.objects.bulk_create([Review(doctor=self.doctor, patient=self.patient, review='Fine', rating=index % 5 + 1)
+                                    for index in range(25)])
+
+    def test_unknown_doctor_id_is_not_found(self):
+        self.assertEqual(self.client.get('/doctors/abc/reviews/').status_code, 404)
+        self.assertEqual(self.client.get('/doctors/abc/reviews/1/').status_code, 404)
+
+    def test_cursor_pages_cover_every_review_once(self):
+        url = f'/doctors/{self.doctor.pk}/reviews/?pagination=cursor&page_size=10'
+        seen = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            # Keyset pages neither count the reviews nor skip rows with OFFSET.
+            for query in queries:
+                self.assertNotIn('__count', query['sql'])
+                self.assertNotIn('OFFSET', query['sql'].upper())
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(sorted(seen), sorted(Review.objects.values_list('id', flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        for index in range(23):
+            create_doctor(index, rating_avg=index % 3, specialization='Cardiology' if index % 2 else 'Cardiac surgery')
+
+    def cursor_tokens(self, url):
+        cursor = parse_qs(urlparse(url).query)['cursor'][0]
+        return parse_qs(b64decode(cursor).decode())
+
+    def walk(self, url, direction='next'):
+        pages = []
+        while url:
+            cache.clear()
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data[direction]
+            if url:
+                tokens = self.cursor_tokens(url)
+                self.assertNotIn('o', tokens)
+                self.assertIn('p', tokens)
+        return pages
+
+    def test_tied_values_are_paged_by_position_alone(self):
+        pages = self.walk('/doctors/?pagination=cursor&ordering=-rating_avg&page_size=5')
+        seen = [pk for page in pages for pk in page]
+        expected = list(Doctor.objects.order_by('-rating_avg', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        # Walking back from the last page returns the same pages.
+        cache.clear()
+        last = self.client.get('/doctors/?pagination=cursor&ordering=-rating_avg&page_size=5')
+        url = last.data['next']
+        while True:
+            cache.clear()
+            response = self.client.get(url)
+            if not response.data['next']:
+                break
+            url = response.data['next']
+        backwards = self.walk(url, 'previous')
+        self.assertEqual(list(reversed(backwards)), pages)
+
+    def test_search_keeps_its_relevance_order(self):
+        pages = self.walk('/doctors/?pagination=cursor&search=cardiology&page_size=4')
+        cache.clear()
+        ranked = [row['id'] for row in self.client.get('/doctors/', {'search': 'cardiology'}).data['results']]
+        self.assertEqual([pk for page in pages for pk in page][:len(ranked)], ranked)
+
+    def test_malformed_cursor_is_not_found(self):
+        for position in (b'p=abc', b'p=%5B%221%22%2C%222%22%5D'):
+            cursor = b64encode(position).decode()
+            response = self.client.get('/doctors/', {'pagination': 'cursor', 'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        for index in range(3):
+            create_doctor(index, image=False)
+        self.filtered = Doctor.objects.filter(specialization='Cardiology')
+
+    def count(self, queryset, threshold):
+        paginator = EstimatedCountPaginator(queryset, 10)
+        paginator.estimate_threshold = threshold
+        with CaptureQueriesContext(connection) as queries:
+            count = paginator.count
+        return count, [query['sql'] for query in queries]
+
+    @skipIf(connection.vendor == 'postgresql', 'covers the fallback for other databases')
+    def test_counts_exactly_off_postgresql(self):
+        for queryset in (Doctor.objects.all(), self.filtered):
+            count, queries = self.count(queryset, threshold=2)
+            self.assertEqual(count, 3)
+            self.assertEqual(len(queries), 1)
+            self.assertIn('COUNT(', queries[0])
+
+    @skipUnless(connection.vendor == 'postgresql', 'reads pg_class and EXPLAIN output')
+    def test_unfiltered_count_uses_the_planner_estimate(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE clinic_doctor')
+        count, queries = self.count(Doctor.objects.all(), threshold=2)
+        self.assertEqual(count, 3)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('pg_class', queries[0])
+        # Below the threshold the estimate is not trusted.
+        count, queries = self.count(Doctor.objects.all(), threshold=10)
+        self.assertEqual(count, 3)
+        self.assertIn('COUNT(', queries[-1])
+
+    @skipUnless(connection.vendor == 'postgresql', 'reads pg_class and EXPLAIN output')
+    def test_filtered_count_never_reads_table_statistics(self):
+        count, queries = self.count(self.filtered, threshold=10)
+        self.assertEqual(count, 3)
+        self.assertFalse(any('pg_class' in sql or 'EXPLAIN' in sql for sql in queries))
+        count, queries = self.count(self.filtered, threshold=2)
+        self.assertGreaterEqual(count, 2)
+        self.assertFalse(any('pg_class' in sql for sql in queries))
+        self.assertTrue(queries[-1].startswith('EXPLAIN'))
+
+
+class BookingTests(APITestCase):
+    def setUp(self):
+        self.doctor = create_doctor(0)
+        self.slot = {'doctor': self.doctor.pk, 'date': '2030-01-07', 'time': '09:00'}
+
+    def book(self, patient, **slot):
+        self.client.force_authenticate(patient.user)
+        return self.client.post('/appointments/create/', {**self.slot, 'patient': patient.pk, **slot})
+
+    def test_taken_slot_is_a_conflict(self):
+        first, second = create_patient(0), create_patient(1)
+        self.assertEqual(self.book(first).status_code, 201)
+        self.assertEqual(self.book(second).status_code, 409)
+        self.assertEqual(self.book(first, time='10:00').status_code, 409)
+
+    def test_rejected_appointment_frees_the_slot(self):
+        first, second = create_patient(0), create_patient(1)
+        self.assertEqual(self.book(first).status_code, 201)
+        Appointment.objects.update(approval='rejected')
+        self.assertEqual(self.book(second).status_code, 201)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs row locks and concurrent connections')
+class ConcurrentBookingTests(TransactionTestCase):
+    bookings = 200
+    workers = 20
+
+    def test_exactly_one_simultaneous_booking_wins(self):
+        doctor = create_doctor(0)
+        patients = [create_patient(index, image=False) for index in range(self.bookings)]
+        start = threading.Event()
+
+        def book(patient):
+            client = APIClient()
+            client.force_authenticate(patient.user)
+            start.wait()
+            try:
+                response = client.post('/appointments/create/', {
+                    'doctor': doctor.pk, 'patient': patient.pk, 'date': '2030-01-07', 'time': '09:00'})
+                return response.status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            results = [pool.submit(book, patient) for patient in patients]
+            start.set()
+            statuses = [result.result() for result in results]
+        self.assertEqual(statuses.count(201), 1)
+        self.assertEqual(statuses.count(409), self.bookings - 1)
+        self.assertEqual(Appointment.objects.filter(doctor=doctor).count(), 1)
+
+
+class AvailabilityCacheTests(TestCase):
+    day = date(2030, 1, 7)
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = create_doctor(0)
+        self.other_doctor = create_doctor(1)
+        self.patient = create_patient(0)
+        for doctor in (self.doctor, self.other_doctor):
+            WorkingHours.objects.create(doctor=doctor, weekday=self.day.weekday(),
+                                        start_time=time(9), end_time=time(10), slot_minutes=30)
+
+    def slots(self, doctor):
+        return get_free_slots(doctor.pk, self.day, self.day)[0]['slots']
+
+    def test_booking_invalidates_the_day_after_commit(self):
+        self.assertEqual(self.slots(self.doctor), ['09:00', '09:30'])
+        with self.captureOnCommitCallbacks() as callbacks:
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=self.day, time=time(9))
+            # Until the booking commits, a miss could only recompute the old rows.
+            self.assertEqual(self.slots(self.doctor), ['09:00', '09:30'])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.slots(self.doctor), ['09:30'])
+
+    def test_moving_an_appointment_frees_the_previous_doctor(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.create(doctor=self.doctor, patient=self.patient,
+                                                     date=self.day, time=time(9))
+        self.assertEqual(self.slots(self.doctor), ['09:30'])
+        self.assertEqual(self.slots(self.other_doctor), ['09:00', '09:30'])
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.doctor = self.other_doctor
+            appointment.save()
+        self.assertEqual(self.slots(self.doctor), ['09:00', '09:30'])
+        self.assertEqual(self.slots(self.other_doctor), ['09:30'])
+
+    def test_misaligned_appointment_takes_every_slot_it_overlaps(self):
+        WorkingHours.objects.filter(doctor=self.doctor).update(end_time=time(11))
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=self.day, time=time(9, 15))
+            Appointment.objects.create(doctor=self.doctor, patient=create_patient(1), date=self.day,
+                                       time=time(10, 10))
+        self.assertEqual(self.slots(self.doctor), [])
+        Appointment.objects.filter(time=time(10, 10)).update(time=time(10, 30))
+        invalidate_doctor(self.doctor.pk)
+        self.assertEqual(self.slots(self.doctor), ['10:00'])
+
+    def test_started_slots_are_not_offered(self):
+        now = timezone.make_aware(datetime.combine(self.day, time(9, 10)))
+        with mock.patch('clinic.availability.timezone.localtime', return_value=now):
+            self.assertEqual(self.slots(self.doctor), ['09:30'])
+            self.assertEqual(get_free_slots(self.doctor.pk, self.day - timedelta(days=7), self.day)[0]['slots'], [])
+        # The cached day still holds every slot for later reads.
+        self.assertEqual(self.slots(self.doctor), ['09:00', '09:30'])
+
+    def test_unknown_doctor_is_not_found(self):
+        self.assertEqual(self.client.get('/doctors/abc/availability/').status_code, 404)
+        self.assertEqual(self.client.get('/doctors/0/availability/').status_code, 404)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = create_doctor(0)
+        self.patient = create_patient(0)
+        self.url = f'/doctors/{self.doctor.pk}/'
+
+    def version(self):
+        return get_response_cache().get(VERSION_KEY)
+
+    def assertInvalidates(self, write, invalidates=True):
+        self.client.get(self.url)
+        version = self.version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            write()
+        # Nothing changes until the write commits.
+        self.assertEqual(self.version(), version)
+        for callback in callbacks:
+            callback()
+        if invalidates:
+            self.assertNotEqual(self.version(), version)
+        else:
+            self.assertEqual(self.version(), version)
+
+    def test_second_request_is_a_hit(self):
+        before = get_cache_stats()
+        first = self.client.get(self.url)
+        # Only the ETag version is read; the doctor comes from the cache.
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+        after = get_cache_stats()
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_doctor_write_invalidates_after_commit(self):
+        def write():
+            self.doctor.charges = 150
+            self.doctor.save()
+        self.assertInvalidates(write)
+        self.assertEqual(str(self.client.get(self.url).data['charges']), '150.00')
+
+    def test_review_write_invalidates_after_commit(self):
+        self.assertInvalidates(lambda: Review.objects.create(
+            doctor=self.doctor, patient=self.patient, review='Fine', rating=4))
+        self.assertEqual(self.client.get(self.url).data['rating_count'], 1)
+
+    def test_only_serialized_user_fields_invalidate(self):
+        user = User.objects.get(pk=self.doctor.user_id)
+
+        def log_in():
+            user.last_login = timezone.now()
+            user.save()
+        self.assertInvalidates(log_in, invalidates=False)
+
+        def set_password():
+            user.set_password('correct-Horse-7')
+            user.save()
+        self.assertInvalidates(set_password, invalidates=False)
+
+        patient = User.objects.get(pk=self.patient.user_id)
+
+        def rename_patient():
+            patient.first_name = 'Renamed'
+            patient.save()
+        self.assertInvalidates(rename_patient, invalidates=False)
+
+        def rename_doctor():
+            user.first_name = 'Renamed'
+            user.save()
+        self.assertInvalidates(rename_doctor)
+        self.assertEqual(self.client.get(self.url).data['first_name'], 'Renamed')
+
+    def test_stats_are_admin_only(self):
+        self.assertEqual(self.client.get('/cache/stats/').status_code, 401)
+        self.client.force_authenticate(User.objects.get(pk=self.patient.user_id))
+        self.assertEqual(self.client.get('/cache/stats/').status_code, 403)
+        self.client.force_authenticate(create_user('admin', 0, is_staff=True))
+        response = self.client.get('/cache/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'hits', 'misses'})
+
+
+class RatingAggregateTests(APITestCase):
+    def setUp(self):
+        self.doctor = create_doctor(0)
+        self.patients = [create_patient(index) for index in range(2)]
+
+    def assertRating(self, doctor, avg, count):
+        doctor.refresh_from_db()
+        self.assertEqual((doctor.rating_avg, doctor.rating_count), (avg, count))
+
+    def review(self, patient, rating, doctor=None):
+        return Review.objects.create(doctor=doctor or self.doctor, patient=patient, review='', rating=rating)
+
+    def test_api_create_and_delete(self):
+        response = self.client.post(f'/doctors/{self.doctor.pk}/reviews/',
+                                    {'patient': self.patients[0].pk, 'rating': 4, 'review': 'Good'})
+        self.assertEqual(response.status_code, 201)
+        self.assertRating(self.doctor, 4, 1)
+        self.client.delete(f'/doctors/{self.doctor.pk}/reviews/{response.data["id"]}/')
+        self.assertRating(self.doctor, 0, 0)
+
+    def test_editing_a_saved_review(self):
+        self.review(self.patients[0], 2)
+        review = Review.objects.get(pk=self.review(self.patients[1], 4).pk)
+        review.rating = 5
+        review.save()
+        self.assertRating(self.doctor, 3.5, 2)
+        review.save()
+        self.assertRating(self.doctor, 3.5, 2)
+
+    def test_moving_a_review_to_another_doctor(self):
+        other = create_doctor(1)
+        review = self.review(self.patients[0], 4)
+        review.doctor = other
+        review.save()
+        self.assertRating(self.doctor, 0, 0)
+        self.assertRating(other, 4, 1)
+
+    def test_cascade_delete_of_a_patient(self):
+        self.review(self.patients[0], 1)
+        self.review(self.patients[1], 5)
+        self.patients[0].user.delete()
+        self.assertRating(self.doctor, 5, 1)
+
+    def test_deferred_rating_is_recounted(self):
+        self.review(self.patients[0], 2)
+        review = Review.objects.only('id', 'doctor').get()
+        review.rating = 4
+        review.save()
+        self.assertRating(self.doctor, 4, 1)
+
+    def test_rebuild_moves_the_review_list_version(self):
+        self.review(self.patients[0], 2)
+        self.review(self.patients[1], 5)
+        past = timezone.now() - timedelta(days=1)
+        Doctor.objects.update(rating_avg=1, rating_count=9, updated_at=past, reviews_updated_at=past)
+        etag = self.client.get(f'/doctors/{self.doctor.pk}/reviews/')['ETag']
+        version = get_response_cache().get_or_set(VERSION_KEY, 1, timeout=None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(rebuild_doctor_ratings(), 1)
+        self.assertRating(self.doctor, 3.5, 2)
+        self.assertGreater(self.doctor.updated_at, past)
+        self.assertGreater(self.doctor.reviews_updated_at, past)
+        self.assertNotEqual(self.client.get(f'/doctors/{self.doctor.pk}/reviews/')['ETag'], etag)
+        self.assertNotEqual(get_response_cache().get(VERSION_KEY), version)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException('Mail server unavailable')
+
+
+class VerificationMailTests(APITestCase):
+    def register(self):
+        return self.client.post('/patients/register/', {
+            'first_name': 'Ada', 'last_name': 'Lovelace', 'gender': 'Female', 'email': 'ada@example.com',
+            'phone_number': '+15550100', 'password': 'analytical-engine-1843', 'birth_date': '1990-12-10'})
+
+    def test_registration_writes_to_the_outbox(self):
+        self.assertEqual(self.register().status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.to, 'ada@example.com')
+
+        out = StringIO()
+        call_command('send_queued_mail', stdout=out)
+        self.assertIn('Sent 1 messages, 0 failed.', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['ada@example.com'])
+        self.assertIn('?token=', mail.outbox[0].body)
+        email.refresh_from_db()
+        self.assertIsNotNone(email.sent_at)
+        self.assertEqual(send_queued_mail(), (0, 0))
+
+    def test_failed_batch_is_drained_in_one_connection(self):
+        for index in range(3):
+            OutgoingEmail.objects.create(subject='Hello', body='Body', to=f'user{index}@example.com')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as opened:
+            self.assertEqual(send_queued_mail(), (3, 0))
+        self.assertEqual(opened.call_count, 1)
+
+    def test_failures_back_off_and_retry(self):
+        email = OutgoingEmail.objects.create(subject='Hello', body='Body', to='user@example.com')
+        with self.settings(EMAIL_BACKEND='clinic.tests.FailingEmailBackend'):
+            self.assertEqual(send_queued_mail(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 1)
+        self.assertIn('unavailable', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(minutes=1))
+        # Waiting out the backoff.
+        self.assertEqual(send_queued_mail(), (0, 0))
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_queued_mail(), (1, 0))
+        email.refresh_from_db()
+        self.assertEqual((email.attempts, email.last_error), (2, ''))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        OutgoingEmail.objects.create(subject='Hello', body='Body', to='user@example.com', attempts=MAX_ATTEMPTS)
+        self.assertEqual(send_queued_mail(), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+
+class DoctorSearchTests(QueryPlanMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.anna = self.doctor(0, 'Anna', 'Smith', 'Cardiology')
+        self.bob = self.doctor(1, 'Bob', 'Cardiff', 'Dermatology')
+
+    def doctor(self, index, first_name, last_name, specialization):
+        doctor = create_doctor(index, image=False, specialization=specialization)
+        doctor.user.first_name = first_name
+        doctor.user.last_name = last_name
+        doctor.user.save()
+        return doctor
+
+    def search(self, text):
+        response = self.client.get('/doctors/', {'search': text})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_prefix_matches_are_ranked_by_field_weight(self):
+        # A last name outweighs a specialization.
+        self.assertEqual(self.search('card'), [self.bob.pk, self.anna.pk])
+        self.assertEqual(self.search('cardiology'), [self.anna.pk])
+        self.assertEqual(self.search('anna cardio'), [self.anna.pk])
+        self.assertEqual(self.search('springfield'), [self.anna.pk, self.bob.pk])
+        self.assertEqual(self.search('neurology'), [])
+
+    def test_index_follows_profile_changes(self):
+        self.anna.user.last_name = 'Jones'
+        self.anna.user.save()
+        cache.clear()
+        self.assertEqual(self.search('smith'), [])
+        self.assertEqual(self.search('jones'), [self.anna.pk])
+        self.anna.location.city = 'Shelbyville'
+        self.anna.location.save()
+        cache.clear()
+        self.assertEqual(self.search('shelbyville'), [self.anna.pk])
+
+    @skipUnless(connection.vendor == 'postgresql', 'SQLite LIKE is case-insensitive and cannot use the index')
+    def test_terms_are_matched_through_the_index(self):
+        self.assertUsesIndex(DoctorSearchTerm.objects.filter(term__startswith='card'), 'doctorsearchterm_term_idx')
+
+
+class DegreeUploadTests(APITestCase):
+    pdf = b'%PDF-1.4 degree'
+
+    def setUp(self):
+        cache.clear()
+        for setting in ('MEDIA_ROOT', 'DEGREE_UPLOAD_TEMP_DIR'):
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            override = override_settings(**{setting: directory.name})
+            override.enable()
+            self.addCleanup(override.disable)
+
+    def upload(self, complete=False):
+        response = self.client.post('/doctors/degrees/uploads/', {'size': len(self.pdf)})
+        self.assertEqual(response.status_code, 201)
+        upload = DegreeUpload.objects.get(pk=response.data['id'])
+        data = self.pdf if complete else self.pdf[:5]
+        response = self.client.put(f'/doctors/degrees/uploads/{upload.pk}/chunk/', data,
+                                   content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE=f'bytes 0-{len(data) - 1}/{len(self.pdf)}')
+        self.assertEqual(response.status_code, 200)
+        upload.refresh_from_db()
+        return upload
+
+    def age(self, upload, hours):
+        DegreeUpload.objects.filter(pk=upload.pk).update(created_at=timezone.now() - timedelta(hours=hours))
+
+    def test_new_uploads_are_throttled(self):
+        # Throttle classes read their rates once, at import.
+        rates = {'degree-uploads': '2/hour', 'degree-upload-chunks': '10/hour'}
+        with mock.patch.object(ScopedRateThrottle, 'THROTTLE_RATES', rates):
+            statuses = [self.client.post('/doctors/degrees/uploads/', {'size': 10}).status_code for _ in range(3)]
+        self.assertEqual(statuses, [201, 201, 429])
+
+    def put_chunk(self, upload, data, start, end=None):
+        end = start + len(data) - 1 if end is None else end
+        return self.client.put(f'/doctors/degrees/uploads/{upload.pk}/chunk/', data,
+                               content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{upload.size}')
+
+    def register(self, degree, email='doctor0@example.com'):
+        return self.client.post('/doctors/register/', {
+            'first_name': 'Doctor', 'last_name': 'Test', 'email': email, 'phone_number': '555-0100',
+            'gender': 'Female', 'password': 'correct-Horse-7', 'specialization': 'Cardiology',
+            'charges': '100.00', 'location.lat': '40.0', 'location.lng': '-74.0',
+            'location.address': '1 Main Street', 'location.city': 'Springfield', 'location.state': 'Illinois',
+            'degree.degree': degree,
+        }, format='multipart')
+
+    def test_chunk_is_claimed_before_it_is_written(self):
+        upload = self.upload()
+        duplicates = []
+
+        def write_after_duplicate(upload, start, end, stream):
+            self.assertEqual(DegreeUpload.objects.get(pk=upload.pk).offset, end + 1)
+            duplicates.append(self.put_chunk(upload, self.pdf[start:], start))
+            return write_chunk(upload, start, end, stream)
+
+        with mock.patch('clinic.views.write_chunk', write_after_duplicate):
+            response = self.put_chunk(upload, self.pdf[5:], 5)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['completed'])
+        self.assertEqual(duplicates[0].status_code, 409)
+        self.assertEqual(duplicates[0].data['offset'], len(self.pdf))
+
+    def test_short_chunk_releases_its_claim(self):
+        upload = self.upload()
+        response = self.put_chunk(upload, self.pdf[5:8], 5, end=len(self.pdf) - 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['offset'], 8)
+        self.assertEqual(DegreeUpload.objects.get(pk=upload.pk).offset, 8)
+        response = self.put_chunk(upload, self.pdf[8:], 8)
+        self.assertTrue(response.data['completed'])
+        with default_storage.open(DegreeUpload.objects.get(pk=upload.pk).degree.name) as file:
+            self.assertEqual(file.read(), self.pdf)
+
+    def test_failed_registration_removes_stored_degree(self):
+        create_user('doctor', 0)
+        response = self.register(ContentFile(self.pdf, name='degree.pdf'))
+        self.assertEqual(response.status_code, 400)
+        name = f'{uploads.DEGREE_DIRECTORY}/{hashlib.sha256(self.pdf).hexdigest()}.pdf'
+        self.assertFalse(default_storage.exists(name))
+
+        # A stored copy shared with a completed upload is kept.
+        stored = self.upload(complete=True)
+        self.assertEqual(stored.degree.name, name)
+        self.assertEqual(self.register(ContentFile(self.pdf, name='degree.pdf')).status_code, 400)
+        self.assertTrue(default_storage.exists(name))
+
+        response = self.register(ContentFile(self.pdf, name='degree.pdf'), email='doctor1@example.com')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(DoctorDegree.objects.get().degree.name, name)
+
+    def test_oversized_degree_stops_the_upload(self):
+        handler = PDFUploadHandler()
+        handler.new_file('degree.degree', 'degree.pdf', 'application/pdf', None)
+        with mock.patch.object(uploads, 'MAX_FILE_SIZE', 16):
+            self.assertIsNone(handler.receive_data_chunk(self.pdf[:8], 0))
+            with self.assertRaises(StopUpload) as raised:
+                handler.receive_data_chunk(self.pdf[:16], 8)
+            self.assertTrue(raised.exception.connection_reset)
+            self.assertTrue(handler.file.closed)
+
+            response = self.register(ContentFile(self.pdf * 8, name='degree.pdf'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('degree', response.data)
+        self.assertFalse(DoctorDegree.objects.exists())
+
+    def test_purge_removes_abandoned_and_unused_uploads(self):
+        abandoned = self.upload()
+        unused = self.upload(complete=True)
+        claimed = self.upload(complete=True)
+        fresh = self.upload()
+        for upload in (abandoned, unused, claimed):
+            self.age(upload, 48)
+        DoctorDegree.objects.create(doctor=create_doctor(0), degree=claimed.degree.name, sha256=claimed.sha256)
+        self.assertTrue(os.path.exists(partial_path(abandoned)))
+        self.assertEqual(claimed.degree.name, unused.degree.name)
+
+        out = StringIO()
+        call_command('purge_degree_uploads', hours=24, stdout=out)
+        self.assertIn('Purged 3 degree uploads.', out.getvalue())
+        self.assertEqual(list(DegreeUpload.objects.values_list('pk', flat=True)), [fresh.pk])
+        self.assertFalse(os.path.exists(partial_path(abandoned)))
+        self.assertTrue(os.path.exists(partial_path(fresh)))
+        # The unused upload shares its stored file with a claimed degree.
+        self.assertTrue(default_storage.exists(claimed.degree.name))
+
+        DoctorDegree.objects.all().delete()
+        stored = self.upload(complete=True)
+        self.age(stored, 48)
+        call_command('purge_degree_uploads', hours=24, stdout=out)
+        self.assertFalse(default_storage.exists(stored.degree.name))
+
+
+class ReviewETagTests(APITestCase):
+    def setUp(self):
+        self.doctor = create_doctor(0)
+        self.patient = create_patient(0)
+        self.review = Review.objects.create(doctor=self.doctor, patient=self.patient, review='Fine', rating=4)
+        self.url = f'/doctors/{self.doctor.pk}/reviews/'
+
+    def etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_unchanged_list_is_a_single_primary_key_lookup(self):
+        etag = self.etag()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"clinic_doctor"."id" =', queries[0]['sql'])
+
+    def test_review_and_patient_changes_move_the_etag(self):
+        etags = [self.etag()]
+        self.review.review = 'Great'
+        self.review.save()
+        etags.append(self.etag())
+        self.patient.user.first_name = 'Renamed'
+        self.patient.user.save()
+        etags.append(self.etag())
+        Review.objects.create(doctor=self.doctor, patient=create_patient(1), review='', rating=2)
+        etags.append(self.etag())
+        self.review.delete()
+        etags.append(self.etag())
+        self.assertEqual(len(set(etags)), len(etags))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.doctor = create_doctor(0, image=False)
+        self.patient = create_patient(0, image=False)
+
+    def appointments(self, count, start=0):
+        Appointment.objects.bulk_create([
+            Appointment(doctor=self.doctor, patient=self.patient,
+                        date=date(2030, 1, 1) + timedelta(days=index // 20), time=time(8 + index % 20 // 2, index % 2 * 30))
+            for index in range(start, start + count)])
+
+    def export(self, *args, **options):
+        out = StringIO()
+        call_command('export_clinic_data', *args, stdout=out, **options)
+        return out.getvalue()
+
+    def test_command_writes_to_its_stdout(self):
+        self.appointments(3)
+        lines = self.export('appointments').splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'date', 'time'])
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(len(self.export('appointments', output='jsonl').splitlines()), 3)
+
+    def test_unpaid_includes_appointments_without_a_payment(self):
+        self.appointments(3)
+        paid, unpaid, missing = Appointment.objects.order_by('pk')
+        Payment.objects.create(appointment=paid, amount=100, paid='paid', payment_method='card')
+        Payment.objects.create(appointment=unpaid, amount=100, paid='unpaid', payment_method='card')
+
+        def ids(value):
+            _, rows = export_rows('appointments', paid=value)
+            return [row[0] for row in rows]
+
+        self.assertEqual(ids('paid'), [paid.pk])
+        self.assertEqual(ids('unpaid'), [unpaid.pk, missing.pk])
+        self.assertEqual(ids(None), [paid.pk, unpaid.pk, missing.pk])
+
+    def peak_memory(self):
+        tracemalloc.start()
+        try:
+            size = sum(len(chunk) for chunk in render_csv(*export_rows('appointments')))
+            return size, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_memory_does_not_grow_with_row_count(self):
+        self.appointments(10000)
+        small_size, small_peak = self.peak_memory()
+        self.appointments(30000, start=10000)
+        large_size, large_peak = self.peak_memory()
+        self.assertGreater(large_size, small_size * 3)
+        # Four times the rows stream through the same few chunks of memory.
+        self.assertLess(large_peak, small_peak * 1.5)
+        self.assertLess(large_peak, 5 * 1024 * 1024)
+
+
+@override_settings(METRICS_TOKEN='scrape-token')
+class MetricsTests(APITestCase):
+    def scrape(self, **headers):
+        return self.client.get('/metrics', **headers)
+
+    def serializer_count(self, route):
+        for line in self.scrape(HTTP_AUTHORIZATION='Bearer scrape-token').content.decode().splitlines():
+            if line.startswith(f'http_request_serializer_duration_seconds_count{{route="{route}",method="GET"}}'):
+                return int(line.rsplit(' ', 1)[1])
+        return 0
+
+    def test_serializer_time_is_recorded_per_route(self):
+        cache.clear()
+        create_doctor(0)
+        before = self.serializer_count('doctors-list')
+        self.assertEqual(self.client.get('/doctors/').status_code, 200)
+        self.assertEqual(self.client.get('/doctors/', {'pagination': 'cursor'}).status_code, 200)
+        self.assertEqual(self.serializer_count('doctors-list'), before + 2)
+
+    def test_metrics_are_not_public(self):
+        self.assertIn(self.scrape().status_code, (401, 403))
+        self.assertIn(self.scrape(HTTP_AUTHORIZATION='Bearer wrong').status_code, (401, 403))
+        with override_settings(METRICS_TOKEN=''):
+            self.assertIn(self.scrape(HTTP_AUTHORIZATION='Bearer ').status_code, (401, 403))
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+        self.client.force_authenticate(create_user('staff', 0, is_staff=True))
+        response = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', response.content.decode())
+
+
+class AsyncEndpointTests(APITestCase):
+    """The async endpoints return the same JSON as the sync viewsets."""
+
+    def setUp(self):
+        cache.clear()
+        for index in range(15):
+            create_doctor(index, charges=100 + index, specialization='Cardiology' if index % 2 else 'Dermatology')
+        self.doctor = Doctor.objects.earliest('pk')
+        for index in range(3):
+            Review.objects.create(doctor=self.doctor, patient=create_patient(index), review='Fine', rating=index + 1)
+
+    def assertSameJSON(self, path, params=None):
+        sync = self.client.get(path, params)
+        cache.clear()
+        response = self.client.get('/async' + path, params)
+        self.assertEqual(response.status_code, sync.status_code, path)
+        # Only the paging links differ, by the /async prefix.
+        self.assertEqual(response.content.decode().replace('/async/', '/'), sync.content.decode(), path)
+
+    def test_responses_match_the_sync_viewsets(self):
+        self.assertSameJSON('/doctors/')
+        self.assertSameJSON('/doctors/', {'page': 2})
+        self.assertSameJSON('/doctors/', {'page': 3})
+        self.assertSameJSON('/doctors/', {'specialization__iexact': 'cardiology', 'ordering': '-charges'})
+        self.assertSameJSON('/doctors/', {'charges__gte': 'many'})
+        self.assertSameJSON(f'/doctors/{self.doctor.pk}/')
+        self.assertSameJSON('/doctors/0/')
+        self.assertSameJSON(f'/doctors/{self.doctor.pk}/reviews/')
+
+    def test_writes_are_not_allowed(self):
+        self.assertEqual(self.client.post('/async/doctors/').status_code, 405)
+        self.assertEqual(self.client.delete(f'/async/doctors/{self.doctor.pk}/').status_code, 405)
+
+    async def test_concurrent_requests(self):
+        responses = await asyncio.gather(*(self.async_client.get('/async/doctors/', {'page': index % 2 + 1})
+                                           for index in range(50)))
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual(sum(len(json.loads(response.content)['results']) for response in responses), 25 * 15)
+
+
+class DeploymentTests(TestCase):
+    def test_gunicorn_serves_the_prod_settings(self):
+        environ = {key: value for key, value in os.environ.items() if key != 'DJANGO_SETTINGS_MODULE'}
+        with mock.patch.dict(os.environ, environ, clear=True):
+            config = runpy.run_path(os.path.join(settings.BASE_DIR, 'config', 'gunicorn.conf.py'))
+        self.assertIn('DJANGO_SETTINGS_MODULE=config.settings.prod', config['raw_env'])
+
+    def test_prod_cache_is_shared_between_workers(self):
+        environ = {key: value for key, value in os.environ.items() if not key.startswith('CACHE_')}
+        with mock.patch.dict(os.environ, environ, clear=True):
+            prod = importlib.reload(importlib.import_module('config.settings.prod'))
+        self.assertNotEqual(prod.CACHES['default']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+
+    def test_prod_hosts_and_static_files(self):
+        with mock.patch.dict(os.environ, {'DJANGO_ALLOWED_HOSTS': 'localhost,api.eclinic.live'}):
+            prod = importlib.reload(importlib.import_module('config.settings.prod'))
+        self.assertEqual(prod.ALLOWED_HOSTS, ['localhost', 'api.eclinic.live'])
+        self.assertTrue(prod.STATIC_ROOT)
+        self.assertIn('whitenoise.middleware.WhiteNoiseMiddleware', prod.MIDDLEWARE)
+        # The settings in use are not touched by importing prod.
+        self.assertNotIn('whitenoise.middleware.WhiteNoiseMiddleware', settings.MIDDLEWARE)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_LAG_SECONDS=10)
+class ReplicaPinTests(APITransactionTestCase):
+    # TestCase wraps tests in a transaction, which the router keeps on the primary.
+    def setUp(self):
+        self.doctor = create_doctor(0)
+        # The test database stands in for the replica.
+        patcher = mock.patch('clinic.replicas.random.choice', return_value='default')
+        self.choose_replica = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_from_replica(self):
+        cache.clear()
+        self.choose_replica.reset_mock()
+        self.assertEqual(self.client.get(f'/doctors/{self.doctor.pk}/').status_code, 200)
+        return self.choose_replica.called
+
+    def test_write_pins_the_client_to_the_primary_in_any_worker(self):
+        self.assertTrue(self.read_from_replica())
+        response = self.client.post('/appointments/create/', {})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        # read_from_replica clears the cache, as another worker would not share it.
+        self.assertFalse(self.read_from_replica())
+        with override_settings(REPLICA_LAG_SECONDS=0):
+            self.assertTrue(self.read_from_replica())
+
+    def test_forged_pin_is_ignored(self):
+        self.client.cookies[PIN_COOKIE] = '1'
+        self.assertTrue(self.read_from_replica())
+
+    def test_anonymous_write_does_not_pin_clients_sharing_its_address(self):
+        cache.clear()
+        self.client.post('/appointments/create/', {})
+        self.choose_replica.reset_mock()
+        self.assertEqual(APIClient().get(f'/doctors/{self.doctor.pk}/').status_code, 200)
+        self.assertTrue(self.choose_replica.called)
+
+    def test_signed_in_write_pins_through_the_cache_without_the_cookie(self):
+        cache.clear()
+        client = APIClient(HTTP_AUTHORIZATION='JWT token')
+        client.post('/appointments/create/', {})
+        self.choose_replica.reset_mock()
+        APIClient(HTTP_AUTHORIZATION='JWT token').get(f'/doctors/{self.doctor.pk}/')
+        self.assertFalse(self.choose_replica.called)
+
+    async def test_middleware_runs_natively_under_asgi(self):
+        # A sync-only middleware would sit behind a SyncToAsync wrapper and
+        # push the rest of the stack into async_to_sync.
+        metrics = ASGIHandler()._middleware_chain.__wrapped__
+        replica = metrics.get_response.__wrapped__
+        self.assertIsInstance(replica, ReplicaMiddleware)
+        self.assertTrue(iscoroutinefunction(replica))
+        self.assertTrue(iscoroutinefunction(replica.get_response))
+        response = await self.async_client.post('/appointments/create/', {})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        response = await self.async_client.get(f'/async/doctors/{self.doctor.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+
+# Only the stored hash matters here, not how slow it is to compute.
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(authentication._users, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.patient = create_patient(0, image=False)
+        self.user = self.patient.user
+        self.user.set_password('first-password')
+        self.user.save()
+
+    def token(self, user=None):
+        return str(TokenObtainPairSerializer.get_token(user or self.user).access_token).encode()
+
+    def authenticate(self, token):
+        auth = CachedJWTAuthentication()
+        return auth.get_user(auth.get_validated_token(token))
+
+    def test_token_claims(self):
+        token = TokenObtainPairSerializer.get_token(self.user)
+        self.assertEqual(token['role'], 'patient')
+        self.assertIs(token['is_active'], True)
+        self.assertEqual(token['ver'], token_version(self.user))
+        self.assertNotIn(token['ver'], hashlib.sha256(self.user.password.encode()).hexdigest())
+        self.assertEqual(token.access_token['ver'], token['ver'])
+
+    def test_cached_user_needs_no_query(self):
+        token = self.token()
+        self.assertEqual(self.authenticate(token).pk, self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(token).pk, self.user.pk)
+
+    @override_settings(AUTH_USER_CACHE_SIZE=2)
+    def test_least_recently_used_user_is_evicted(self):
+        users = [self.user] + [create_patient(index, image=False).user for index in (1, 2)]
+        tokens = [self.token(user) for user in users]
+        for token in tokens:
+            self.authenticate(token)
+        with self.assertNumQueries(0):
+            self.authenticate(tokens[1])
+            self.authenticate(tokens[2])
+        with self.assertNumQueries(1):
+            self.authenticate(tokens[0])
+
+    def test_password_change_revokes_the_token(self):
+        token = self.token()
+        self.authenticate(token)
+        self.user.set_password('second-password')
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_deactivation_revokes_the_token(self):
+        token = self.token()
+        self.authenticate(token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_other_processes_accept_a_stale_user_until_the_entry_expires(self):
+        token = self.token()
+        self.authenticate(token)
+        # A queryset update skips the post_save eviction, as in another process.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.authenticate(token).pk, self.user.pk)
+        expired = time_module.monotonic() + settings.AUTH_USER_CACHE_TIMEOUT + 1
+        with mock.patch('clinic.authentication.time.monotonic', return_value=expired):
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(token)
+
+
+class MediaTests(TestCase):
+    body = b'%PDF-1.4 ' + bytes(range(256)) * 4
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_root = os.path.join(directory.name, 'media')
+        override = override_settings(MEDIA_ROOT=media_root, MEDIA_ACCEL_REDIRECT_PREFIX='')
+        override.enable()
+        self.addCleanup(override.disable)
+        for name in ('media/doctors/degrees/degree.pdf', 'media/users/images/doctor0.jpg', 'secret.txt'):
+            os.makedirs(os.path.join(directory.name, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(directory.name, name), 'wb') as file:
+                file.write(self.body)
+        self.doctor = create_doctor(0, image=False)
+        DoctorDegree.objects.create(doctor=self.doctor, degree='doctors/degrees/degree.pdf')
+        self.url = '/media/doctors/degrees/degree.pdf'
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, **headers)
+        response.body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response
+
+    def test_degree_is_only_served_to_its_doctor_and_staff(self):
+        self.assertEqual(self.get().status_code, 404)
+        self.client.force_login(create_patient(0).user)
+        self.assertEqual(self.get().status_code, 404)
+        self.client.force_login(self.doctor.user)
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, self.body)
+        self.assertTrue(response['Cache-Control'].startswith('private'))
+        self.client.force_login(create_user('staff', 0, is_staff=True))
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_public_media_is_served_to_anyone(self):
+        response = self.get('/media/users/images/doctor0.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Cache-Control'].startswith('public'))
+
+    def test_traversal_is_not_found(self):
+        self.client.force_login(create_user('staff', 0, is_staff=True))
+        # secret.txt sits next to MEDIA_ROOT.
+        for url in ('/media/../secret.txt', '/media/users/../../secret.txt', '/media//etc/passwd'):
+            with self.subTest(url):
+                self.assertEqual(self.get(url).status_code, 404)
+        self.client.logout()
+        # Normalising the path must not get around the private prefix.
+        for url in ('/media/doctors//degrees/degree.pdf', '/media/users/../doctors/degrees/degree.pdf'):
+            with self.subTest(url):
+                self.assertEqual(self.get(url).status_code, 404)
+
+    def test_ranges(self):
+        self.client.force_login(self.doctor.user)
+        size = len(self.body)
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{size}')
+        self.assertEqual(response.body, self.body[10:20])
+        response = self.get(HTTP_RANGE='bytes=-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.body, self.body[-5:])
+        response = self.get(HTTP_RANGE=f'bytes={size - 3}-')
+        self.assertEqual(response.body, self.body[-3:])
+        response = self.get(HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+        # A stale If-Range gets the whole file.
+        response = self.get(HTTP_RANGE='bytes=0-4', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get(self):
+        self.client.force_login(self.doctor.user)
+        etag = self.get()['ETag']
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.body, b'')
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_accel_redirect_hands_the_body_to_the_proxy(self):
+        self.client.force_login(self.doctor.user)
+        with override_settings(MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/'):
+            response = self.get()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Accel-Redirect'], '/protected-media/doctors/degrees/degree.pdf')
+            self.assertEqual(response.body, b'')
+            self.client.logout()
+            self.assertEqual(self.get().status_code, 404)
+
+
+class ImageProcessingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(MEDIA_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = create_user('patient', 0)
+        self.user_image = UserImage.objects.create(user=self.user, image=self.upload('upload.png'))
+
+    def upload(self, name, size=(600, 300)):
+        buffer = ContentFile(b'', name=name)
+        Image.new('P', size).save(buffer, format='PNG')
+        return default_storage.save(f'users/images/{name}', buffer)
+
+    def process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            process_user_image(self.user_image.pk)
+        self.user_image.refresh_from_db()
+
+    def test_writes_variants_and_replaces_original(self):
+        uploaded = self.user_image.image.name
+        self.process()
+        self.assertRegex(self.user_image.image.name, r'^users/images/upload.*\.jpeg$')
+        self.assertFalse(default_storage.exists(uploaded))
+        self.assertEqual(set(self.user_image.thumbnails), {'webp', 'jpeg'})
+        for extension, variants in self.user_image.thumbnails.items():
+            self.assertEqual(sorted(variants, key=int), ['64', '128', '256', '512'])
+            for width, name in variants.items():
+                with default_storage.open(name) as file, Image.open(file) as image:
+                    self.assertEqual(image.format.lower(), extension)
+                    self.assertEqual(image.size, (int(width), int(width) // 2))
+
+    def test_pick_variant(self):
+        self.assertEqual(pick_variant(self.user_image, 100), self.user_image.image.name)
+        self.process()
+        variants = self.user_image.thumbnails
+        self.assertEqual(pick_variant(self.user_image, 100), variants['webp']['128'])
+        self.assertEqual(pick_variant(self.user_image, 128, 'jpeg'), variants['jpeg']['128'])
+        self.assertEqual(pick_variant(self.user_image, 1000), self.user_image.image.name)
+
+    def test_skips_widths_beyond_the_image(self):
+        self.user_image.image = self.upload('small.png', size=(200, 100))
+        self.user_image.save()
+        self.process()
+        self.assertEqual(sorted(self.user_image.thumbnails['webp'], key=int), ['64', '128'])
+
+    def test_newer_upload_wins(self):
+        newer = self.upload('newer.png')
+        written = []
+        save = default_storage.save
+
+        def replace_during_processing(name, content):
+            if not written:
+                UserImage.objects.filter(pk=self.user_image.pk).update(image=newer)
+            written.append(save(name, content))
+            return written[-1]
+
+        with mock.patch.object(default_storage, 'save', replace_during_processing):
+            self.process()
+        self.assertEqual(self.user_image.image.name, newer)
+        self.assertEqual(self.user_image.thumbnails, {})
+        self.assertEqual(len(written), 9)
+        self.assertFalse(any(default_storage.exists(name) for name in written))
+
+    def test_replacing_and_deleting_remove_variants(self):
+        self.process()
+        processed = [self.user_image.image.name,
+                     *(name for variants in self.user_image.thumbnails.values() for name in variants.values())]
+        self.user_image = UserImage.objects.get(pk=self.user_image.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_image.image = self.upload('replacement.png')
+            self.user_image.thumbnails = {}
+            self.user_image.save()
+        self.assertFalse(any(default_storage.exists(name) for name in processed))
+        replacement = self.user_image.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_image.delete()
+        self.assertFalse(default_storage.exists(replacement))
+
+    def test_reprocess_command(self):
+        out = StringIO()
+        call_command('process_user_images', stdout=out)
+        self.assertIn('Processed 1 images.', out.getvalue())
+        self.user_image.refresh_from_db()
+        self.assertTrue(self.user_image.thumbnails)
+        call_command('process_user_images', stdout=out)
+        self.assertIn('Processed 0 images.', out.getvalue())
+
+
+class ImportTests(TestCase):
+    columns = ['email', 'phone_number', 'first_name', 'last_name', 'gender', 'password',
+               'specialization', 'charges', 'lat', 'lng', 'address', 'city', 'state']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hashed = make_password('unused')
+
+    def doctor_row(self, index, **values):
+        row = {'email': f'import{index}@example.com', 'phone_number': f'import-{index}',
+               'first_name': f'Imported{index}', 'last_name': 'Doctor', 'gender': 'Female',
+               'password': self.hashed, 'specialization': 'Neurology', 'charges': '150',
+               'lat': '40.5', 'lng': '-74.2', 'address': f'{index} Elm Street', 'city': 'Shelbyville',
+               'state': 'Illinois'}
+        row.update(values)
+        return row
+
+    def run_import(self, rows):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'doctors.csv')
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, self.columns)
+            writer.writeheader()
+            writer.writerows(rows)
+        out, err = StringIO(), StringIO()
+        call_command('import_clinic_data', path, role='doctor', workers=1, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import(self):
+        rows = [
+            self.doctor_row(0),
+            self.doctor_row(1, password='a-long Passphrase 42'),
+            self.doctor_row(2, charges='0'),
+            self.doctor_row(3, email='import0@EXAMPLE.com'),
+            self.doctor_row(4, password='1234'),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            out, err = self.run_import(rows)
+        self.assertIn('Imported 2 of 5 rows', out)
+        self.assertIn('Line 4: charges:', err)
+        self.assertIn('Line 5: A user with email import0@example.com already exists.', err)
+        self.assertIn('Line 6: password:', err)
+
+        doctors = Doctor.objects.select_related('user', 'location').order_by('user__email')
+        self.assertEqual([doctor.user.email for doctor in doctors], ['import0@example.com', 'import1@example.com'])
+        first, second = doctors
+        self.assertEqual(first.location.city, 'Shelbyville')
+        self.assertEqual(first.user.password, rows[0]['password'])
+        self.assertTrue(second.user.check_password('a-long Passphrase 42'))
+        self.assertFalse(first.user.is_active)
+        self.assertTrue(DoctorSearchTerm.objects.filter(doctor=second, term='neurology').exists())
+        self.assertEqual(OutgoingEmail.objects.filter(to__in=['import0@example.com', 'import1@example.com']).count(), 2)
+        self.assertEqual(Location.objects.count(), 2)
+
+        out, err = self.run_import(rows)
+        self.assertIn('Imported 0 of 5 rows', out)
+        self.assertEqual(Doctor.objects.count(), 2)
+        self.assertEqual(Location.objects.count(), 2)
+
+    def test_passwords_are_hashed_in_worker_processes(self):
+        existing = make_password('kept')
+        with ProcessPoolExecutor(2, initializer=init_hash_worker) as executor:
+            hashed = hash_passwords(['first secret', existing, 'second secret'], executor)
+        self.assertEqual(hashed[1], existing)
+        self.assertTrue(check_password('first secret', hashed[0]))
+        self.assertTrue(check_password('second secret', hashed[2]))
@@ -0,0 +1,189 @@
+import hashlib
+import os
+import re
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.utils import timezone
+
+from .models import DegreeUpload, DoctorDegree
+from .validators import MAX_FILE_SIZE
+
+PDF_MAGIC = b'%PDF-'
+DEGREE_DIRECTORY = 'doctors/degrees'
+READ_CHUNK_SIZE = 64 * 1024
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class PDFUploadHandler(FileUploadHandler):
+    """Hash, size-check and sniff degree PDFs while they stream to disk.
+
+    Other file fields are passed on to the default handlers untouched.
+    The completed file carries `sha256` and `is_pdf` attributes. A file
+    over MAX_FILE_SIZE stops the upload instead of reading the rest.
+    """
+    field_name_suffix = 'degree'
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.active = field_name.split('.')[-1] == self.field_name_suffix
+        if self.active:
+            self.file = TemporaryUploadedFile(
+                self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+            self.hash = hashlib.sha256()
+            self.head = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if start + len(raw_data) > MAX_FILE_SIZE:
+            self.file.close()
+            raise StopUpload(connection_reset=True)
+        if len(self.head) < len(PDF_MAGIC):
+            self.head += raw_data[:len(PDF_MAGIC) - len(self.head)]
+        self.hash.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hash.hexdigest()
+        self.file.is_pdf = self.head == PDF_MAGIC
+        return self.file
+
+    def upload_interrupted(self):
+        if getattr(self, 'active', False):
+            self.file.close()
+
+
+def inspect_pdf(file):
+    """Return (sha256, is_pdf) for a file, reading it chunk by chunk if needed."""
+    if hasattr(file, 'sha256'):
+        return file.sha256, file.is_pdf
+    digest = hashlib.sha256()
+    head = b''
+    file.seek(0)
+    for chunk in file.chunks(READ_CHUNK_SIZE):
+        if len(head) < len(PDF_MAGIC):
+            head += chunk[:len(PDF_MAGIC) - len(head)]
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest(), head == PDF_MAGIC
+
+
+def store_degree(file, sha256):
+    """Save a degree under its content hash, reusing an identical stored copy.
+
+    Runs outside any transaction; callers reference the returned name.
+    """
+    name = f'{DEGREE_DIRECTORY}/{sha256}.pdf'
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, file)
+
+
+def discard_degree(name):
+    """Delete a stored degree unless a degree or an upload references it."""
+    if not (DoctorDegree.objects.filter(degree=name).exists()
+            or DegreeUpload.objects.filter(degree=name).exists()):
+        default_storage.delete(name)
+
+
+def partial_path(upload):
+    return os.path.join(settings.DEGREE_UPLOAD_TEMP_DIR, f'{upload.pk}.part')
+
+
+def parse_content_range(header, size):
+    """Return the (start, end) byte positions of a Content-Range header, or None."""
+    match = CONTENT_RANGE.match(header or '')
+    if not match:
+        return None
+    start, end, total = (int(value) for value in match.groups())
+    if total != size or start > end or end >= total:
+        return None
+    return start, end
+
+
+def claim_chunk(upload, start, end):
+    """Move the offset past bytes start..end if it is still at `start`.
+
+    Only the request that wins the claim may write the range, so two
+    clients sending the same chunk never write the file at once.
+    """
+    return bool(DegreeUpload.objects.filter(pk=upload.pk, completed=False, offset=start)
+                .update(offset=end + 1))
+
+
+def release_chunk(upload, offset):
+    """Move the offset back after a claimed chunk arrived short."""
+    DegreeUpload.objects.filter(pk=upload.pk, completed=False).update(offset=offset)
+
+
+def write_chunk(upload, start, end, stream):
+    """Write bytes start..end from a stream; return the number of bytes written."""
+    if stream is None:
+        return 0
+    os.makedirs(settings.DEGREE_UPLOAD_TEMP_DIR, exist_ok=True)
+    path = partial_path(upload)
+    written = 0
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as partial:
+        partial.seek(start)
+        for data in iter(lambda: stream.read(READ_CHUNK_SIZE), b''):
+            data = data[:end + 1 - start - written]
+            if not data:
+                break
+            partial.write(data)
+            written += len(data)
+    return written
+
+
+def finish_upload(upload):
+    """Verify and store a fully received upload. Return False if it is not a PDF."""
+    path = partial_path(upload)
+    with open(path, 'rb') as partial:
+        sha256, is_pdf = inspect_pdf(File(partial))
+        if is_pdf:
+            upload.degree.name = store_degree(File(partial), sha256)
+            upload.sha256 = sha256
+            upload.completed = True
+    os.remove(path)
+    return is_pdf
+
+
+def purge_stale_uploads(max_age_hours):
+    """Delete uploads older than max_age_hours with the files only they use.
+
+    Covers abandoned partial uploads and completed ones that no registration
+    claimed. Stored files are shared by content hash, so a file is kept
+    while a degree or a newer upload still points at it. Partial files left
+    without an upload row are removed by age. Returns the number of uploads
+    deleted.
+    """
+    cutoff = timezone.now() - timedelta(hours=max_age_hours)
+    stale = list(DegreeUpload.objects.filter(created_at__lt=cutoff))
+    names = {upload.degree.name for upload in stale if upload.degree}
+    in_use = set(DoctorDegree.objects.filter(degree__in=names).values_list('degree', flat=True))
+    in_use.update(DegreeUpload.objects.filter(created_at__gte=cutoff, degree__in=names)
+                  .values_list('degree', flat=True))
+    DegreeUpload.objects.filter(pk__in=[upload.pk for upload in stale]).delete()
+    for upload in stale:
+        if os.path.exists(partial_path(upload)):
+            os.remove(partial_path(upload))
+    for name in names - in_use:
+        default_storage.delete(name)
+
+    live = {f'{pk}.part' for pk in DegreeUpload.objects.values_list('pk', flat=True)}
+    if os.path.isdir(settings.DEGREE_UPLOAD_TEMP_DIR):
+        for entry in os.scandir(settings.DEGREE_UPLOAD_TEMP_DIR):
+            if entry.name.endswith('.part') and entry.name not in live \
+                    and entry.stat().st_mtime < time.time() - max_age_hours * 3600:
+                os.remove(entry.path)
+    return len(stale)
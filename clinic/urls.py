@@ -2,15 +2,17 @@ from django.urls import path
 from rest_framework_nested.routers import SimpleRouter, NestedSimpleRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from .views import index, UserProfileViewSet, DoctorRegisterViewSet, DoctorListViewSet, \
+from .async_views import doctor_list, doctor_detail, doctor_reviews
+from .views import index, cache_stats, metrics, export_data, UserProfileViewSet, DoctorRegisterViewSet, DoctorListViewSet, \
                 DoctorRetrieveViewSet, PatientRegisterViewSet, PatientRetrieveViewSet, ReviewViewSet, \
-                AppointmentViewSet, UserImageViewSet, VerifyUserViewSet
+                AppointmentViewSet, UserImageViewSet, VerifyUserViewSet, DegreeUploadViewSet
 
 router = SimpleRouter()
 router.register('auth/users', UserProfileViewSet, basename='users')
 router.register('users/images', UserImageViewSet, basename='users-images')
 router.register('users', VerifyUserViewSet, basename='users-verify')
 router.register('doctors/register', DoctorRegisterViewSet, basename='doctors-register')
+router.register('doctors/degrees/uploads', DegreeUploadViewSet, basename='doctors-degrees-uploads')
 router.register('doctors', DoctorListViewSet, basename='doctors')
 router.register('doctors', DoctorRetrieveViewSet, basename='doctors')
 doctors_router = NestedSimpleRouter(router, r'doctors', lookup='doctors')
@@ -22,6 +24,12 @@ router.register('patients', PatientRetrieveViewSet, basename='patients')
 router.register('appointments/create', AppointmentViewSet, basename='appoinments-create')
 
 urlpatterns = [path('', index),
+               path('cache/stats/', cache_stats),
+               path('metrics', metrics),
+               path('async/doctors/', doctor_list),
+               path('async/doctors/<int:pk>/', doctor_detail),
+               path('async/doctors/<int:doctor_pk>/reviews/', doctor_reviews),
+               path('exports/<str:name>/', export_data),
                path('auth/signin/', TokenObtainPairView.as_view()),
                 path('auth/refresh/', TokenRefreshView.as_view())
                ] + router.urls + doctors_router.urls
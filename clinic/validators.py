@@ -1,7 +1,9 @@
 from django.core.exceptions import ValidationError
 
+MAX_FILE_SIZE = 2 * 1024 * 1024
+
 def validate_file_size(file):
-    max_size = 2 * 1024 * 1024
+    max_size = MAX_FILE_SIZE
 
     if file.size > max_size:
         raise ValidationError(f'File size should not exceed {max_size} bytes')
\ No newline at end of file
@@ -1,38 +1,91 @@
+from datetime import date, timedelta
+import hashlib
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, ListModelMixin
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound
+from rest_framework.throttling import ScopedRateThrottle
 from django_filters.rest_framework import DjangoFilterBackend
 import jwt
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 
-from .filtering import DoctorFilter
-from .pagination import DefaultPagination
-from .models import Doctor, User, Patient, Review, Appointment, UserImage
+from .availability import get_free_slots, MAX_AVAILABILITY_DAYS
+from .caching import CachedListMixin, CachedRetrieveMixin, get_cache_stats
+from .etags import ConditionalListMixin, ConditionalRetrieveMixin, row_version
+from .exports import EXPORTS, OUTPUT_FORMATS, RENDERERS, export_rows
+from .filtering import DoctorFilter, get_facets
+from .images import LIST_IMAGE_WIDTH, DETAIL_IMAGE_WIDTH
+from .metrics import HasMetricsToken, render_metrics
+from .pagination import DefaultPagination, KeysetPaginationMixin
+from .profiles import get_profile, get_role
+from .search import DoctorSearchFilter
+from .uploads import PDFUploadHandler, parse_content_range, claim_chunk, release_chunk, write_chunk, finish_upload
+from .models import Doctor, User, Patient, Review, Appointment, UserImage, DegreeUpload
 from .serializers import DoctorSerializer, DoctorUpdateSerializer, PatientSerializer, \
                         PatientUpdateSerializer, ReviewSerializer, AppointmentSerializer, \
-                            UserImageSerializer, TokenSerializer
+                            UserImageSerializer, TokenSerializer, DegreeUploadSerializer
+
+FACETS_TIMEOUT = 60
+
 # Create your views here.
 def index(request):
     return render(request, 'index.html')
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    return Response(get_cache_stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser | HasMetricsToken])
+def metrics(request):
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_data(request, name):
+    # DRF reserves ?format= for renderer selection, hence ?output=.
+    output = request.query_params.get('output', 'csv')
+    if name not in EXPORTS:
+        return Response({'error': f'Unknown export "{name}".'}, status=404)
+    if output not in RENDERERS:
+        return Response({'error': f'"output" must be one of: {", ".join(RENDERERS)}.'}, status=400)
+    params = request.query_params
+    try:
+        columns, rows = export_rows(name, params.get('from'), params.get('to'),
+                                    params.get('doctor'), params.get('paid'))
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=400)
+    response = StreamingHttpResponse(RENDERERS[output](columns, rows), content_type=OUTPUT_FORMATS[output])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{output}"'
+    return response
+
+
 class UserProfileViewSet(RetrieveModelMixin, GenericViewSet):
     queryset = User.objects.all()
     permission_classes = [IsAuthenticated]
 
     def get_serializer_class(self):
-        is_doctor = Doctor.objects.filter(user_id=self.request.user.id).exists()
-        is_patient = Patient.objects.filter(user_id=self.request.user.id).exists()
-        if is_doctor:
+        profile = get_profile(self.request)
+        if profile is None:
+            raise NotFound('This user has no doctor or patient profile.')
+        if isinstance(profile, Doctor):
             if self.request.method == 'PUT':
                 return DoctorUpdateSerializer
             return DoctorSerializer
-        elif is_patient:
+        elif isinstance(profile, Patient):
             if self.request.method == 'PUT':
                 return PatientUpdateSerializer
             return PatientSerializer
@@ -44,26 +97,25 @@ class UserProfileViewSet(RetrieveModelMixin, GenericViewSet):
 
     @action(detail=False, methods=['GET', 'PUT'])
     def me(self, request):
-        is_doctor = Doctor.objects.filter(user_id=request.user.id).exists()
-        is_patient = Patient.objects.filter(user_id=request.user.id).exists()
+        profile = get_profile(request)
+        if profile is None:
+            raise NotFound('This user has no doctor or patient profile.')
         context = self.get_serializer_context()
-        if is_doctor:
-            doctor = Doctor.objects.get(user_id=request.user.id)
+        if isinstance(profile, Doctor):
             if request.method == 'GET':
-                serializer = DoctorSerializer(doctor, context=context)
+                serializer = DoctorSerializer(profile, context=context)
                 return Response(serializer.data)
             if request.method == 'PUT':
-                serializer = DoctorUpdateSerializer(doctor, data=request.data)
+                serializer = DoctorUpdateSerializer(profile, data=request.data)
                 serializer.is_valid(raise_exception=True)
                 serializer.save()
                 return Response(serializer.data)
-        elif is_patient:
-            patient = Patient.objects.get(user_id=request.user.id)
+        elif isinstance(profile, Patient):
             if request.method == 'GET':
-                serializer = PatientSerializer(patient, context=context)
+                serializer = PatientSerializer(profile, context=context)
                 return Response(serializer.data)
             if request.method == 'PUT':
-                serializer = PatientUpdateSerializer(patient, data=request.data)
+                serializer = PatientUpdateSerializer(profile, data=request.data)
                 serializer.is_valid(raise_exception=True)
                 serializer.save()
                 return Response(serializer.data)
@@ -73,18 +125,107 @@ class DoctorRegisterViewSet(CreateModelMixin, GenericViewSet):
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
 
-class DoctorListViewSet(ListModelMixin, GenericViewSet):
-    queryset = Doctor.objects.select_related().all()
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers.insert(0, PDFUploadHandler(request))
+        return super().initialize_request(request, *args, **kwargs)
+
+class DegreeUploadViewSet(CreateModelMixin, RetrieveModelMixin, GenericViewSet):
+    """Resumable degree uploads: create with the total size, then PUT chunks with Content-Range.
+
+    Uploads happen before the doctor has an account, so they are anonymous
+    and throttled per client instead. purge_degree_uploads removes the ones
+    never used for a registration.
+    """
+    queryset = DegreeUpload.objects.all()
+    serializer_class = DegreeUploadSerializer
+    throttle_classes = [ScopedRateThrottle]
+
+    def get_throttles(self):
+        self.throttle_scope = 'degree-uploads' if self.action == 'create' else 'degree-upload-chunks'
+        return super().get_throttles()
+
+    @action(detail=True, methods=['PUT'])
+    def chunk(self, request, pk=None):
+        upload = self.get_object()
+        if upload.completed:
+            return Response({'error': 'Upload is already complete.'}, status=status.HTTP_409_CONFLICT)
+        content_range = parse_content_range(request.headers.get('Content-Range'), upload.size)
+        if content_range is None:
+            return Response({'error': 'A valid Content-Range header is required.'}, status=400)
+        start, end = content_range
+        # Only one client can claim this chunk, and only the claimant writes it.
+        if not claim_chunk(upload, start, end):
+            upload.refresh_from_db()
+            return Response({'error': 'Chunk does not start at the current offset.', 'offset': upload.offset},
+                            status=status.HTTP_409_CONFLICT)
+        written = write_chunk(upload, start, end, request.stream)
+        if written != end - start + 1:
+            release_chunk(upload, start + written)
+            return Response({'error': 'Chunk is shorter than its Content-Range.', 'offset': start + written},
+                            status=400)
+        upload.offset = end + 1
+        if upload.offset == upload.size:
+            if not finish_upload(upload):
+                upload.delete()
+                return Response({'error': 'File is not a PDF document.'}, status=400)
+            upload.save(update_fields=['degree', 'sha256', 'completed'])
+        return Response(self.get_serializer(upload).data)
+
+class DoctorListViewSet(CachedListMixin, KeysetPaginationMixin, ListModelMixin, GenericViewSet):
+    queryset = Doctor.objects.select_related('user', 'location', 'user__userimage').all()
     serializer_class = DoctorSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    replica_actions = ('list',)
+    filter_backends = [DjangoFilterBackend, DoctorSearchFilter, OrderingFilter]
     filterset_class = DoctorFilter
-    search_fields = ['user__first_name', 'user__last_name', 'location__address', 'location__city', 'location__state']
-    ordering_fields = ['user__first_name', 'user__last_name', 'charges']
+    ordering_fields = ['user__first_name', 'user__last_name', 'charges', 'rating_avg']
     pagination_class = DefaultPagination
 
-class DoctorRetrieveViewSet(RetrieveModelMixin, GenericViewSet):
-    queryset = Doctor.objects.select_related().all()
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'image_width': LIST_IMAGE_WIDTH}
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        names = [name for name in self.request.query_params.get('facets', '').split(',') if name]
+        if names:
+            response.data['facets'] = self.get_facets(names)
+        return response
+
+    def get_facets(self, names):
+        params = self.request.query_params.copy()
+        for param in ('page', 'page_size', 'cursor', 'pagination', 'ordering'):
+            params.pop(param, None)
+        key = 'doctor-facets:' + hashlib.md5(params.urlencode().encode()).hexdigest()
+        facets = cache.get(key)
+        if facets is None:
+            facets = get_facets(self.filter_queryset(self.get_queryset()), names)
+            cache.set(key, facets, FACETS_TIMEOUT)
+        return facets
+
+class DoctorRetrieveViewSet(ConditionalRetrieveMixin, CachedRetrieveMixin, RetrieveModelMixin, GenericViewSet):
+    queryset = Doctor.objects.select_related('user', 'location', 'user__userimage').all()
     serializer_class = DoctorSerializer
+    replica_actions = ('retrieve',)
+
+    def get_etag_version(self):
+        return row_version(Doctor.objects, self.kwargs['pk'], 'updated_at')
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'image_width': DETAIL_IMAGE_WIDTH}
+
+    @action(detail=True, methods=['GET'])
+    def availability(self, request, pk=None):
+        try:
+            start = date.fromisoformat(request.query_params.get('from', date.today().isoformat()))
+            end = date.fromisoformat(request.query_params.get('to', (start + timedelta(days=6)).isoformat()))
+        except ValueError:
+            return Response({'error': 'Dates must be in YYYY-MM-DD format.'}, status=400)
+        if end < start:
+            return Response({'error': 'The "to" date must not be before the "from" date.'}, status=400)
+        if (end - start).days >= MAX_AVAILABILITY_DAYS:
+            return Response({'error': f'At most {MAX_AVAILABILITY_DAYS} days can be requested.'}, status=400)
+        if not pk.isdigit() or not Doctor.objects.filter(pk=pk).exists():
+            return Response({'error': 'Doctor not found.'}, status=404)
+        return Response(get_free_slots(pk, start, end))
 
 class PatientRegisterViewSet(CreateModelMixin, GenericViewSet):
     queryset = Patient.objects.all()
@@ -98,13 +239,45 @@ class PatientRegisterViewSet(CreateModelMixin, GenericViewSet):
             'message': 'Patient created successfully.'
         })
 
-class PatientRetrieveViewSet(RetrieveModelMixin, GenericViewSet):
-    queryset = Patient.objects.select_related().all()
+class PatientRetrieveViewSet(ConditionalRetrieveMixin, RetrieveModelMixin, GenericViewSet):
+    queryset = Patient.objects.select_related('user', 'user__userimage').all()
     serializer_class = PatientSerializer
+    replica_actions = ('retrieve',)
+
+    def get_etag_version(self):
+        version = row_version(Patient.objects, self.kwargs['pk'], 'updated_at')
+        # The serialized age changes with the date, not with the row.
+        return version and (*version, date.today())
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'image_width': DETAIL_IMAGE_WIDTH}
 
-class ReviewViewSet(ModelViewSet):
-    queryset = Review.objects.select_related().all()
+class ReviewViewSet(ConditionalListMixin, ConditionalRetrieveMixin, KeysetPaginationMixin, ModelViewSet):
     serializer_class = ReviewSerializer
+    replica_actions = ('list', 'retrieve')
+
+    def get_doctor_id(self):
+        doctor_id = self.kwargs['doctors_pk']
+        if not doctor_id.isdigit():
+            raise NotFound()
+        return int(doctor_id)
+
+    def get_queryset(self):
+        # patient_name reads patient.user; nothing else on the row is followed.
+        return Review.objects.select_related('patient__user').filter(doctor_id=self.get_doctor_id())
+
+    def get_etag_version(self):
+        doctor_id = self.get_doctor_id()
+        if self.action == 'retrieve':
+            reviews = Review.objects.filter(doctor_id=doctor_id)
+            return row_version(reviews, self.kwargs['pk'], 'updated_at', 'patient__updated_at')
+        # Review writes and patient renames move the doctor's stamp.
+        return row_version(Doctor.objects, doctor_id, 'reviews_updated_at')
+
+    def perform_destroy(self, instance):
+        # Deleting the review and updating the doctor's rating commit together.
+        with transaction.atomic():
+            instance.delete()
 
 class AppointmentViewSet(CreateModelMixin, GenericViewSet):
     queryset = Appointment.objects.select_related().all()
@@ -112,16 +285,33 @@ class AppointmentViewSet(CreateModelMixin, GenericViewSet):
     permission_classes = [IsAuthenticated]
 
     def create(self, request, *args, **kwargs):
-        is_patient = Patient.objects.filter(user_id=request.user.id).exists()
-        if is_patient:
-            if Appointment.objects.filter(patient=request.data['patient'], date=request.data['date']).filter(doctor=request.data['doctor']).exists():
-                return Response({'error': 'You already have an appointment on the same date.'}, status=400)
-            if Appointment.objects.filter(doctor=request.data['doctor'], date=request.data['date'], time=request.data['time']).exists():
-                return Response({'error': 'Doctor is not available at this time.'}, status=400)
-            
-            return super().create(request, *args, **kwargs)
-        
-        return Response({'error': 'Only patients can create appointments.'}, status=403)
+        if get_role(request) != 'patient':
+            return Response({'error': 'Only patients can create appointments.'}, status=403)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        doctor = serializer.validated_data['doctor']
+        patient = serializer.validated_data['patient']
+        slot_date = serializer.validated_data['date']
+        slot_time = serializer.validated_data['time']
+        try:
+            with transaction.atomic():
+                # Locking the doctor row serializes concurrent bookings for that doctor,
+                # and unique_active_doctor_slot backs this up at the database level.
+                Doctor.objects.select_for_update().filter(pk=doctor.pk).order_by().first()
+                if Appointment.objects.filter(patient=patient, doctor=doctor, date=slot_date).exists():
+                    return Response({'error': 'You already have an appointment on the same date.'},
+                                    status=status.HTTP_409_CONFLICT)
+                if Appointment.objects.filter(doctor=doctor, date=slot_date, time=slot_time) \
+                        .exclude(approval='rejected').exists():
+                    return Response({'error': 'Doctor is not available at this time.'},
+                                    status=status.HTTP_409_CONFLICT)
+                self.perform_create(serializer)
+        except IntegrityError:
+            return Response({'error': 'Doctor is not available at this time.'},
+                            status=status.HTTP_409_CONFLICT)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
         
 
 class UserImageViewSet(ModelViewSet):
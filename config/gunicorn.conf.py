@@ -0,0 +1,43 @@
+"""Gunicorn settings for running eclinic in production.
+
+    gunicorn -c config/gunicorn.conf.py
+
+Every value can be overridden through the GUNICORN_* environment variables.
+Set GUNICORN_ASGI=1 to serve config.asgi through Uvicorn workers (requires
+the uvicorn package), which lets the async endpoints hold many slow
+connections per process.
+"""
+import multiprocessing
+import os
+
+cpu_count = multiprocessing.cpu_count()
+
+# wsgi.py and asgi.py default to the dev settings; gunicorn serves prod.
+raw_env = ['DJANGO_SETTINGS_MODULE=' + os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings.prod')]
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+if os.environ.get('GUNICORN_ASGI') == '1':
+    wsgi_app = 'config.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    workers = int(os.environ.get('GUNICORN_WORKERS', cpu_count))
+else:
+    wsgi_app = 'config.wsgi:application'
+    # Threads overlap database and network waits inside each process.
+    worker_class = 'gthread'
+    workers = int(os.environ.get('GUNICORN_WORKERS', cpu_count * 2 + 1))
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import Django and the project once in the master; workers fork from it.
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to cap slow memory growth.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
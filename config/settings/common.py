@@ -37,7 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',    
+    'django.contrib.postgres',
     'django_filters',
     'rest_framework',
     'corsheaders',
@@ -46,8 +46,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'clinic.metrics.MetricsMiddleware',
+    'clinic.replicas.ReplicaMiddleware',
     "corsheaders.middleware.CorsMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,12 +60,6 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'config.urls'
 
-INTERNAL_IPS = [
-    # ...
-    "127.0.0.1",
-    # ...
-]
-
 CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
     "http://localhost:3000",
@@ -100,9 +95,52 @@ DATABASES = {
         'PASSWORD': env('PASSWORD'),
         'HOST': env('HOST'),
         'PORT': env('PORT'),
+        # Keep connections open between requests; the health check replaces
+        # ones the server closed instead of failing the next request.
+        'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', default=60),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Set when connecting through pgbouncer in transaction pooling mode, where
+# server-side cursors do not survive between transactions. QuerySet.iterator()
+# then fetches whole result sets, so large exports should bypass the pooler.
+if env.bool('DB_POOLER', default=False):
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# Read replicas, e.g. DB_REPLICA_HOSTS=replica1.internal,replica2.internal.
+# List and retrieve requests of views with replica_actions read from them.
+DATABASE_REPLICAS = []
+for index, host in enumerate(env.list('DB_REPLICA_HOSTS', default=[]), start=1):
+    alias = f'replica{index}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['clinic.replicas.ReplicaRouter']
+# Upper bound on replication lag: clients read from the primary for this
+# long after their own writes.
+REPLICA_LAG_SECONDS = env.int('REPLICA_LAG_SECONDS', default=10)
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': env('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': env('CACHE_LOCATION', default='eclinic'),
     }
 }
 
+# Doctor list and detail responses are cached in this alias until a
+# related model changes or the timeout expires.
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = env.int('RESPONSE_CACHE_TIMEOUT', default=300)
+
+# Requests slower than this are logged with their SQL by MetricsMiddleware.
+METRICS_SLOW_REQUEST_MS = env.int('METRICS_SLOW_REQUEST_MS', default=500)
+# /metrics is served to staff and to scrapers sending this bearer token.
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -139,9 +177,23 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
 
 STATIC_URL = 'static/'
+# collectstatic gathers static files here for the prod server.
+STATIC_ROOT = env('STATIC_ROOT', default=os.path.join(BASE_DIR, 'staticfiles'))
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_CACHE_MAX_AGE = env.int('MEDIA_CACHE_MAX_AGE', default=30 * 24 * 60 * 60)
+# Internal nginx location aliased to MEDIA_ROOT, e.g. '/protected-media/'.
+# When set, media bodies are sent by the proxy through X-Accel-Redirect.
+MEDIA_ACCEL_REDIRECT_PREFIX = env('MEDIA_ACCEL_REDIRECT_PREFIX', default='')
+
+# Partially uploaded degree PDFs are kept here until the last chunk arrives.
+DEGREE_UPLOAD_TEMP_DIR = env('DEGREE_UPLOAD_TEMP_DIR', default=os.path.join(BASE_DIR, 'uploads'))
+# purge_degree_uploads deletes uploads no registration used within this many hours.
+DEGREE_UPLOAD_MAX_AGE_HOURS = env.int('DEGREE_UPLOAD_MAX_AGE_HOURS', default=24)
+
+# Threads per process that resize uploaded profile images.
+IMAGE_PROCESSING_WORKERS = env.int('IMAGE_PROCESSING_WORKERS', default=2)
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -150,15 +202,26 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING': False,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'clinic.authentication.CachedJWTAuthentication',
+    ),
+    # Degree uploads come before registration, so they are limited per client address.
+    'DEFAULT_THROTTLE_RATES': {
+        'degree-uploads': env('DEGREE_UPLOAD_RATE', default='10/hour'),
+        'degree-upload-chunks': env('DEGREE_UPLOAD_CHUNK_RATE', default='300/hour'),
+    },
 }
 
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('JWT',),
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'clinic.serializers.TokenObtainPairSerializer',
 }
 
+# Authenticated users are kept in a per-process LRU for this many seconds.
+# Other processes honour a password change or deactivation only once it expires.
+AUTH_USER_CACHE_SIZE = env.int('AUTH_USER_CACHE_SIZE', default=1024)
+AUTH_USER_CACHE_TIMEOUT = env.int('AUTH_USER_CACHE_TIMEOUT', default=60)
+
 AUTH_USER_MODEL = 'clinic.User'
 
 ACCOUNT_AUTHENTICATION_METHOD = 'email'
@@ -1,3 +1,14 @@
 from .common import *
 
-DEBUG = True
\ No newline at end of file
+DEBUG = True
+
+INSTALLED_APPS += ['debug_toolbar']
+
+MIDDLEWARE.insert(MIDDLEWARE.index('corsheaders.middleware.CorsMiddleware') + 1,
+                  'debug_toolbar.middleware.DebugToolbarMiddleware')
+
+INTERNAL_IPS = [
+    # ...
+    "127.0.0.1",
+    # ...
+]
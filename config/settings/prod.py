@@ -2,4 +2,20 @@ from .common import *
 
 DEBUG = False
 
-ALLOWED_HOSTS = ["api.eclinic.live"]
\ No newline at end of file
+ALLOWED_HOSTS = env.list('DJANGO_ALLOWED_HOSTS', default=["api.eclinic.live"])
+
+# Gunicorn serves the collected static files (the admin's CSS and JS) itself.
+MIDDLEWARE = MIDDLEWARE.copy()
+MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                  'whitenoise.middleware.WhiteNoiseMiddleware')
+
+# Gunicorn runs several worker processes, so cache invalidations and
+# availability versions must live in a cache they all share. Set
+# CACHE_BACKEND to django.core.cache.backends.redis.RedisCache to share it
+# across hosts too.
+CACHES = {
+    'default': {
+        'BACKEND': env('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': env('CACHE_LOCATION', default='/var/lib/eclinic/data/cache'),
+    }
+}
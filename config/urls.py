@@ -14,16 +14,21 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.conf import settings
-from django.conf.urls.static import static
-import debug_toolbar
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
+
+from .views import serve_media
 
 admin.site.site_header = 'Eclinic Admin'
 admin.site.index_title = 'Admin'
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('__degbug__/', include(debug_toolbar.urls)),
     path('', include('clinic.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), serve_media),
+]
+
+if 'debug_toolbar' in settings.INSTALLED_APPS:
+    import debug_toolbar
+
+    urlpatterns.insert(1, path('__degbug__/', include(debug_toolbar.urls)))
@@ -0,0 +1,143 @@
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+
+from clinic.models import DoctorDegree
+
+# Media under these prefixes is only served to its owner and to staff.
+PRIVATE_MEDIA_PREFIXES = ('doctors/degrees/',)
+PRIVATE_MAX_AGE = 60 * 60
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _authenticated_user(request):
+    if request.user.is_authenticated:
+        return request.user
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authentication_class().authenticate(request)
+        except APIException:
+            return None
+        if result is not None:
+            return result[0]
+    return None
+
+
+def _can_read_private(request, path):
+    user = _authenticated_user(request)
+    if user is None:
+        return False
+    return user.is_staff or DoctorDegree.objects.filter(degree=path, doctor__user=user).exists()
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def _requested_range(request, etag, size):
+    """Return (start, end) for a single satisfiable byte range, 'invalid', or None."""
+    match = RANGE_HEADER.match(request.META.get('HTTP_RANGE', ''))
+    if not match:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return 'invalid'
+    if start > end or start >= size:
+        return 'invalid'
+    return start, end
+
+
+def _read_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(STREAM_CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve MEDIA_ROOT with validators, byte ranges and long-lived caching.
+
+    With MEDIA_ACCEL_REDIRECT_PREFIX set, the file body is handed to the
+    front proxy via X-Accel-Redirect; otherwise FileResponse streams it,
+    which uses the server's sendfile support when available.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    private = path.startswith(PRIVATE_MEDIA_PREFIXES)
+    if private and not _can_read_private(request, path):
+        raise Http404
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    byte_range = _requested_range(request, etag, stat.st_size)
+
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+    elif settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+        # The proxy answers ranges and sends the body itself.
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(path)
+    elif byte_range == 'invalid':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+    elif byte_range is not None:
+        start, end = byte_range
+        length = end - start + 1
+        body = _read_range(open(full_path, 'rb'), start, length) if request.method == 'GET' else []
+        response = StreamingHttpResponse(body, status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = str(length)
+    elif request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = str(stat.st_size)
+    else:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    if private:
+        response['Cache-Control'] = f'private, max-age={PRIVATE_MAX_AGE}'
+    else:
+        response['Cache-Control'] = f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    return response